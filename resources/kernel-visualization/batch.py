@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from PIL import Image
+
+from convolution import BORDER_MODES
+from image_utils import apply_kernel, COLOR_MODES
+from image_loader import image_files
+from kernels import REGISTRY, GENERATORS
+
+# Per output directory: the settings each output file was made with
+MANIFEST_NAME = '.batch-manifest.json'
+
+def preset_names():
+    """Names of the KernelFilters presets"""
+    return sorted(REGISTRY.preset_names())
+
+# --preset help shared with the other command-line tools
+PRESET_HELP = (f"KernelFilters preset ({', '.join(preset_names())}) or generator spec "
+               f"like gaussian:sigma=4 ({', '.join(GENERATORS)})")
+
+def load_kernel(preset=None, kernel_file=None):
+    """Get a kernel from a preset name or generator spec, or a file (.npy, or whitespace-separated text)"""
+    if preset:
+        return REGISTRY.get(preset)
+    if kernel_file.endswith('.npy'):
+        kernel = np.load(kernel_file)
+    else:
+        kernel = np.loadtxt(kernel_file, ndmin=2)
+    if kernel.ndim != 2:
+        raise ValueError(f"Kernel must be 2D, got shape {kernel.shape}")
+    return kernel
+
+def settings_key(kernel, mode, border):
+    """Hash of everything besides the source file that determines an output"""
+    weights = np.ascontiguousarray(kernel, dtype=float)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((weights.shape, mode, border)).encode())
+    digest.update(weights.tobytes())
+    return digest.hexdigest()
+
+def load_manifest(output_dir):
+    """{output file name: settings_key} of an output directory ({} if there is none)"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest of an output directory (atomically)"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Error writing {path}: {e}", file=sys.stderr)
+
+def is_up_to_date(src, dst, dependencies=(), key=None, manifest=None):
+    """True if dst exists, is newer than src and every dependency, and was made with the same settings
+
+    key is the settings_key of this run; manifest (see load_manifest)
+    records the key each output was made with. Without a key only the
+    modification times are compared.
+    """
+    if not os.path.exists(dst):
+        return False
+    if key is not None and (manifest or {}).get(os.path.basename(dst)) != key:
+        return False
+    dst_mtime = os.path.getmtime(dst)
+    return all(os.path.getmtime(path) <= dst_mtime for path in (src,) + tuple(dependencies))
+
+def process_file(src, dst, kernel, mode, border='black'):
+    """Decode, convolve and encode one image (runs in a worker process)
+
+    Returns:
+        Number of megapixels processed
+    """
+    with Image.open(src) as image:
+        result = apply_kernel(image, kernel, mode, border=border)
+        megapixels = image.width * image.height / 1e6
+    if mode == 'RGBA' and dst.lower().endswith(('.jpg', '.jpeg')):
+        result = result.convert('RGB')  # JPEG has no alpha channel
+    result.save(dst)
+    return megapixels
+
+def find_jobs(input_dir, output_dir, dependencies=(), force=False, key=None, manifest=None):
+    """List (src, dst) pairs that need processing and count skipped files (see is_up_to_date)"""
+    jobs = []
+    skipped = 0
+    for src in image_files(input_dir):
+        dst = os.path.join(output_dir, os.path.basename(src))
+        if not force and is_up_to_date(src, dst, dependencies, key, manifest):
+            skipped += 1
+        else:
+            jobs.append((src, dst))
+    return jobs, skipped
+
+def run_batch(jobs, kernel, mode='L', workers=None, max_in_flight=None, border='black', on_done=None):
+    """Process jobs in a process pool with a bounded number of in-flight tasks
+
+    on_done(src, dst) is called in this process after each image is written.
+
+    Returns:
+        (images processed, megapixels processed, failures)
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    done_images = 0
+    done_megapixels = 0.0
+    failures = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        remaining = iter(jobs)
+        while True:
+            # Keep at most max_in_flight tasks queued, so memory stays bounded
+            # however many files there are
+            for src, dst in remaining:
+                pending[pool.submit(process_file, src, dst, kernel, mode, border)] = (src, dst)
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                src, dst = pending.pop(future)
+                try:
+                    done_megapixels += future.result()
+                    done_images += 1
+                    if on_done is not None:
+                        on_done(src, dst)
+                except Exception as e:
+                    print(f"Error processing {src}: {e}", file=sys.stderr)
+                    failures += 1
+
+    return done_images, done_megapixels, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a kernel to every image in a directory")
+    parser.add_argument('input_dir', help="Directory with the source images")
+    parser.add_argument('output_dir', help="Directory for the filtered images (created if needed)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--preset', help=PRESET_HELP)
+    source.add_argument('--kernel', help="Kernel file: .npy or whitespace-separated text")
+    parser.add_argument('--mode', choices=COLOR_MODES, default='L', help="Processing mode (default: L)")
+    parser.add_argument('--border', choices=BORDER_MODES, default='black',
+                        help="Edge handling: black (original), or pad by zero, reflect, replicate or wrap")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="Maximum queued images (default: 2 x workers)")
+    parser.add_argument('--force', action='store_true',
+                        help="Reprocess images that are up to date (outputs made with another kernel, "
+                             "mode or border are always reprocessed)")
+    args = parser.parse_args(argv)
+
+    try:
+        kernel = load_kernel(args.preset, args.kernel)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    dependencies = (args.kernel,) if args.kernel else ()
+    key = settings_key(kernel, args.mode, args.border)
+    manifest = load_manifest(args.output_dir)
+    jobs, skipped = find_jobs(args.input_dir, args.output_dir, dependencies, args.force, key, manifest)
+    print(f"{len(jobs)} images to process, {skipped} up to date")
+
+    # Outputs about to be overwritten lose their entry first, so an
+    # interrupted run never leaves a new file recorded with old settings
+    for _, dst in jobs:
+        manifest.pop(os.path.basename(dst), None)
+    save_manifest(args.output_dir, manifest)
+
+    def record(src, dst):
+        manifest[os.path.basename(dst)] = key
+
+    start = time.perf_counter()
+    try:
+        images, megapixels, failures = run_batch(jobs, kernel, args.mode, args.workers, args.max_in_flight,
+                                                 args.border, record)
+    finally:
+        save_manifest(args.output_dir, manifest)
+    elapsed = time.perf_counter() - start
+
+    rate = f"{images / elapsed:.1f} images/s, {megapixels / elapsed:.1f} MP/s" if elapsed > 0 else "-"
+    print(f"Processed {images} images ({megapixels:.1f} MP) in {elapsed:.2f}s: {rate}")
+    if failures:
+        print(f"{failures} images failed", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
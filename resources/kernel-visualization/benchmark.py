@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import numpy as np
+from PIL import ImageOps
+
+from filters import KernelFilters, all_presets
+from image_utils import create_test_image, create_mario_image, apply_kernel, pil_to_pygame, SurfaceConverter, IMAGE_DISPLAY_SIZE
+from convolution import (normalize_kernel, to_uint8, select_backend, BACKENDS,
+                         CostModel, DEFAULT_COST_MODEL, filter_array, band_backend)
+from parallel import ParallelFilter
+from kernels import box
+
+SCALING_THREADS = [1, 2, 4, 8]
+BOX_RADII = [1, 2, 4, 8, 16, 32, 64]
+NOISE_FLOOR_S = 0.0005  # Slowdowns smaller than this are never regressions
+SHORT_CASE_S = 0.005  # Cases faster than this are compared by their fastest run
+
+# Default matrix of the suite: 200x200 (the built-in images) up to 8K UHD
+SUITE_SIZES = [(200, 200), (640, 480), (1920, 1080), (3840, 2160), (7680, 4320)]
+SUITE_KERNEL_SIZES = [3, 9, 31]
+SYNTHETIC_IMAGES = {'test': create_test_image, 'mario': create_mario_image}
+
+def legacy_convolve2d(img_array, kernel):
+    """The original per-pixel loop from image_utils.apply_kernel (reference)"""
+    height, width = img_array.shape
+    k_height, k_width = kernel.shape
+    pad_h = k_height // 2
+    pad_w = k_width // 2
+    output = np.zeros_like(img_array, dtype=float)
+    for i in range(pad_h, height - pad_h):
+        for j in range(pad_w, width - pad_w):
+            roi = img_array[i - pad_h:i + pad_h + 1, j - pad_w:j + pad_w + 1]
+            output[i, j] = np.sum(roi * kernel)
+    return output
+
+def time_call(func, repeat=3):
+    """Return the best wall time of func() over a few runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_engine(sizes, legacy_max_pixels):
+    """Compare the legacy loop with the vectorized engine (megapixels per second)"""
+    kernel = KernelFilters.gaussian_blur()
+    normalized = normalize_kernel(kernel)
+    print(f"{'size':>12} {'legacy MP/s':>12} {'vectorized MP/s':>16} {'speedup':>8}")
+    for size in sizes:
+        img_array = np.array(ImageOps.grayscale(create_test_image(size)))
+        megapixels = size[0] * size[1] / 1e6
+
+        fast = time_call(lambda: filter_array(img_array, kernel))
+        if size[0] * size[1] <= legacy_max_pixels:
+            slow = time_call(lambda: legacy_convolve2d(img_array, normalized), repeat=1)
+            # The legacy float sums may land a hair below a whole gray level
+            legacy_output = to_uint8(legacy_convolve2d(img_array, normalized)).astype(int)
+            assert np.abs(legacy_output - filter_array(img_array, kernel)).max() <= 1
+            legacy = f"{megapixels / slow:12.3f}"
+            speedup = f"{slow / fast:7.0f}x"
+        else:
+            legacy, speedup = f"{'skipped':>12}", f"{'-':>8}"
+
+        print(f"{size[0]:>5}x{size[1]:<6} {legacy} {megapixels / fast:16.2f} {speedup}")
+
+def bench_backends(sizes, kernel_sizes, calibrate):
+    """Time every backend per image/kernel size and show what 'auto' picks"""
+    cost_model = CostModel().calibrate() if calibrate else None
+    rng = np.random.default_rng(0)
+    print(f"{'size':>12} {'kernel':>7} " + " ".join(f"{b + ' ms':>12}" for b in BACKENDS) + f" {'auto':>10}")
+    for size in sizes:
+        img_array = np.array(ImageOps.grayscale(create_test_image(size)))
+        for k in kernel_sizes:
+            # Random integer kernel (dense), a Gaussian-like rank-1 one and a box
+            for kernel in (rng.integers(-5, 6, size=(k, k)).astype(float),
+                           np.outer(np.hanning(k + 2)[1:-1], np.hanning(k + 2)[1:-1]),
+                           np.ones((k, k))):
+                cells = []
+                for backend in BACKENDS:
+                    if DEFAULT_COST_MODEL.work(backend, img_array.shape, kernel) is None:
+                        cells.append(f"{'-':>12}")
+                        continue
+                    elapsed = time_call(lambda: filter_array(img_array, kernel, backend))
+                    cells.append(f"{elapsed * 1000:12.2f}")
+                chosen = select_backend(img_array.shape, kernel, cost_model)
+                print(f"{size[0]:>5}x{size[1]:<6} {k:>3}x{k:<3} " + " ".join(cells) + f" {chosen:>10}")
+
+def bench_scaling(sizes, kernel_sizes, threads, repeat):
+    """Row-band parallel filtering at several thread counts vs single-threaded filter_array
+
+    Reports the median time per thread count and the speedup over
+    filter_array, and checks that every parallel result is identical to
+    filter_array with the band-safe backend the parallel path chooses.
+    """
+    rng = np.random.default_rng(0)
+    print(f"{os.cpu_count()} CPU cores")
+    print(f"{'size':>12} {'kernel':>7} {'backend':>10} {'filter_array ms':>16} "
+          + " ".join(f"{f'{n} thread' + ('s' if n > 1 else ''):>16}" for n in threads))
+    filters = {n: ParallelFilter(n) for n in threads}
+    try:
+        for size in sizes:
+            img_array = np.array(ImageOps.grayscale(create_test_image(size)))
+            for k in kernel_sizes:
+                # A dense integer kernel and a Gaussian-like float one
+                for kernel in (rng.integers(-5, 6, size=(k, k)),
+                               np.outer(np.hanning(k + 2)[1:-1], np.hanning(k + 2)[1:-1])):
+                    backend = band_backend(img_array.shape, kernel)  # What the parallel 'auto' runs
+                    expected = filter_array(img_array, kernel, backend)
+                    out = np.empty_like(expected)
+                    single = statistics.median(time_runs(lambda: filter_array(img_array, kernel, backend, out=out),
+                                                         repeat=repeat))
+                    cells = []
+                    for n in threads:
+                        parallel = filters[n]
+                        elapsed = statistics.median(time_runs(lambda: parallel.filter(img_array, kernel, out=out),
+                                                              repeat=repeat))
+                        if not np.array_equal(out, expected):
+                            print(f"Error: {n}-thread result differs from filter_array ({size}, {k}x{k})")
+                        cells.append(f"{elapsed * 1000:9.1f} {single / elapsed:5.2f}x")
+                    print(f"{size[0]:>5}x{size[1]:<6} {f'{k}x{k}':>7} {backend:>10} {single * 1000:16.1f} "
+                          + " ".join(cells))
+    finally:
+        for parallel in filters.values():
+            parallel.close()
+
+def bench_box(sizes, radii, repeat):
+    """Box blur of growing radius: summed-area table vs separable passes
+
+    The separable cost grows linearly with the radius (and direct with its
+    square); the summed-area table's should stay flat. Also shows what
+    'auto' picks and checks that both backends give the same result.
+    """
+    print(f"{'size':>12} {'radius':>7} {'kernel':>9} {'separable ms':>13} {'box ms':>9} {'auto':>10}")
+    for size in sizes:
+        img_array = np.array(ImageOps.grayscale(create_test_image(size)))
+        out = np.empty_like(img_array)
+        for radius in radii:
+            kernel = box(radius)
+            times = {}
+            results = {}
+            for backend in ('separable', 'box'):
+                times[backend] = statistics.median(
+                    time_runs(lambda: filter_array(img_array, kernel, backend, out=out), repeat=repeat))
+                results[backend] = out.copy()
+            if not np.array_equal(results['separable'], results['box']):
+                print(f"Error: box and separable results differ ({size}, radius {radius})")
+            side = f"{2 * radius + 1}x{2 * radius + 1}"
+            print(f"{size[0]:>5}x{size[1]:<6} {radius:>7} {side:>9} {times['separable'] * 1000:13.2f} "
+                  f"{times['box'] * 1000:9.2f} {select_backend(img_array.shape, kernel):>10}")
+
+def time_runs(func, warmup=1, repeat=5):
+    """Run func warmup times untimed, then return the wall times of repeat runs"""
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def suite_cases(sizes, kernel_sizes, images, max_estimate):
+    """Yield (name, megapixels, func) for every case of the suite matrix
+
+    Cases are apply_kernel with every preset, filter_array with every
+    backend on square random dense and rank-1 kernels, and display conversion (pil_to_pygame from the
+    image, SurfaceConverter from an RGB array; full size and display size).
+    Backend cases the cost model expects to take longer than max_estimate
+    seconds (e.g. a dense 31x31 kernel at 8K with the direct backend) are left out.
+    """
+    presets = all_presets()
+    converter = SurfaceConverter()
+    rng = np.random.default_rng(0)
+    kernels = {}
+    for k in kernel_sizes:
+        # A dense kernel, and a rank-1 one so the separable backend runs too
+        kernels[f"{k}x{k}-dense"] = rng.integers(-5, 6, size=(k, k)).astype(float)
+        factor = rng.integers(1, 5, size=k)
+        kernels[f"{k}x{k}-rank1"] = np.outer(factor, factor).astype(float)
+    for kind in images:
+        for size in sizes:
+            # Generated lazily, so filtering cases by name skips unused images
+            image = None
+            def get_image():
+                nonlocal image
+                if image is None:
+                    image = SYNTHETIC_IMAGES[kind](size)
+                return image
+            label = f"{kind}/{size[0]}x{size[1]}"
+            megapixels = size[0] * size[1] / 1e6
+
+            for preset, kernel in presets.items():
+                yield (f"apply_kernel/{label}/{preset}", megapixels,
+                       lambda kernel=kernel: apply_kernel(get_image(), kernel))
+            for k, kernel in kernels.items():
+                gray = None
+                for backend in BACKENDS:
+                    estimate = DEFAULT_COST_MODEL.estimate(backend, (size[1], size[0]), kernel)
+                    if estimate is None or estimate > max_estimate:
+                        continue
+                    def run(kernel=kernel, backend=backend):
+                        nonlocal gray
+                        if gray is None:
+                            gray = np.array(ImageOps.grayscale(get_image()))
+                        filter_array(gray, kernel, backend)
+                    yield f"backend/{label}/{k}/{backend}", megapixels, run
+            yield f"pil_to_pygame/{label}/full", megapixels, lambda: pil_to_pygame(get_image())
+            yield (f"pil_to_pygame/{label}/display", megapixels,
+                   lambda: pil_to_pygame(get_image(), IMAGE_DISPLAY_SIZE))
+            rgb = None
+            def to_surface(size=None):
+                nonlocal rgb
+                if rgb is None:
+                    rgb = np.asarray(get_image())
+                converter.to_surface(rgb, size)
+            yield f"to_surface/{label}/full", megapixels, to_surface
+            yield f"to_surface/{label}/display", megapixels, lambda: to_surface(IMAGE_DISPLAY_SIZE)
+
+def run_suite(sizes, kernel_sizes, images, pattern=None, warmup=1, repeat=5, max_estimate=5.0):
+    """Time every suite case matching pattern
+
+    Returns:
+        {case name: {'median_s', 'min_s', 'megapixels', 'mp_per_s'}}
+    """
+    results = {}
+    for name, megapixels, func in suite_cases(sizes, kernel_sizes, images, max_estimate):
+        if pattern and not re.search(pattern, name):
+            continue
+        times = time_runs(func, warmup, repeat)
+        median = statistics.median(times)
+        results[name] = {
+            'median_s': median,
+            'min_s': min(times),
+            'megapixels': megapixels,
+            'mp_per_s': megapixels / median,
+        }
+        print(f"{name:<52} {median * 1000:10.2f} ms {megapixels / median:9.1f} MP/s", flush=True)
+    return results
+
+def save_baseline(path, results, warmup, repeat):
+    """Write suite results and the environment they were measured in to JSON"""
+    baseline = {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'warmup': warmup,
+            'repeat': repeat,
+        },
+        'cases': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+def compare_results(baseline, results, threshold, noise_floor=NOISE_FLOOR_S):
+    """Print the change of each case against a baseline
+
+    Cases whose baseline median is under SHORT_CASE_S are compared by their
+    fastest run, which scheduler and cache noise can only make slower.
+
+    Returns:
+        Names of cases whose time grew by more than threshold (0.1 = 10%)
+        and by more than noise_floor seconds
+    """
+    regressions = []
+    print(f"\n{'case':<52} {'baseline ms':>12} {'current ms':>11} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline['cases'].get(name)
+        if previous is None:
+            print(f"{name:<52} {'-':>12} {current['median_s'] * 1000:11.2f} {'new':>8}")
+            continue
+        stat = 'min_s' if previous['median_s'] < SHORT_CASE_S and 'min_s' in previous else 'median_s'
+        before, after = previous[stat], current[stat]
+        change = after / before - 1
+        flag = ""
+        if after - before > max(threshold * before, noise_floor):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<52} {before * 1000:12.2f} {after * 1000:11.2f} "
+              f"{change:+8.1%}{flag}")
+    return regressions
+
+def bench_suite(args):
+    """Run the suite, then save it as a baseline and/or compare with one"""
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading baseline {args.compare}: {e}")
+            return 2
+
+    results = run_suite(args.sizes, args.kernel_sizes, args.images, args.match,
+                        args.warmup, args.repeat, args.max_estimate)
+    if args.save:
+        save_baseline(args.save, results, args.warmup, args.repeat)
+        print(f"Saved {len(results)} cases to {args.save}")
+    if baseline is None:
+        return 0
+
+    regressions = compare_results(baseline, results, args.threshold, args.noise_floor / 1000)
+    if regressions:
+        print(f"\n{len(regressions)} of {len(results)} cases regressed by more than {args.threshold:.0%}")
+        return 1
+    print(f"\nNo regressions above {args.threshold:.0%}")
+    return 0
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convolution engine benchmarks")
+    subparsers = parser.add_subparsers(dest='command')
+
+    engine = subparsers.add_parser('engine', help="Legacy per-pixel loop vs vectorized engine")
+    engine.add_argument('--sizes', nargs='+', type=parse_size,
+                        default=[(200, 200), (640, 480), (1920, 1080)],
+                        help="Image sizes as WIDTHxHEIGHT")
+    engine.add_argument('--legacy-max-pixels', type=int, default=640 * 480,
+                        help="Skip the slow per-pixel loop above this many pixels")
+
+    backends = subparsers.add_parser('backends', help="Direct vs separable vs FFT backends")
+    backends.add_argument('--sizes', nargs='+', type=parse_size,
+                          default=[(200, 200), (1920, 1080)],
+                          help="Image sizes as WIDTHxHEIGHT")
+    backends.add_argument('--kernel-sizes', nargs='+', type=int, default=[5, 15, 31, 63])
+    backends.add_argument('--calibrate', action='store_true',
+                          help="Calibrate the cost model on this machine before choosing")
+
+    scaling = subparsers.add_parser('scaling', help="Row-band parallel speedup at several thread counts")
+    scaling.add_argument('--sizes', nargs='+', type=parse_size, default=[(1920, 1080), (3840, 2160)],
+                         help="Image sizes as WIDTHxHEIGHT")
+    scaling.add_argument('--kernel-sizes', nargs='+', type=int, default=[3, 9, 31])
+    scaling.add_argument('--threads', nargs='+', type=int, default=SCALING_THREADS,
+                         help="Thread counts to time (default: 1 2 4 8)")
+    scaling.add_argument('--repeat', type=int, default=5, help="Timed runs per case (the median is reported)")
+
+    box_blur = subparsers.add_parser('box', help="Summed-area table vs separable box blur as the radius grows")
+    box_blur.add_argument('--sizes', nargs='+', type=parse_size, default=[(1920, 1080)],
+                          help="Image sizes as WIDTHxHEIGHT")
+    box_blur.add_argument('--radii', nargs='+', type=int, default=BOX_RADII,
+                          help="Box radii (kernel size 2 * radius + 1)")
+    box_blur.add_argument('--repeat', type=int, default=5, help="Timed runs per case (the median is reported)")
+
+    suite = subparsers.add_parser('suite', help="Full benchmark matrix, with JSON baselines")
+    suite.add_argument('--sizes', nargs='+', type=parse_size, default=SUITE_SIZES,
+                       help="Image sizes as WIDTHxHEIGHT (default: 200x200 up to 7680x4320)")
+    suite.add_argument('--kernel-sizes', nargs='+', type=int, default=SUITE_KERNEL_SIZES,
+                       help="Square kernel sizes for the backend cases")
+    suite.add_argument('--images', nargs='+', choices=sorted(SYNTHETIC_IMAGES), default=['mario', 'test'],
+                       help="Synthetic images to generate")
+    suite.add_argument('--match', help="Only run cases whose name matches this regular expression")
+    suite.add_argument('--warmup', type=int, default=1, help="Untimed runs per case")
+    suite.add_argument('--repeat', type=int, default=5, help="Timed runs per case (the median is reported)")
+    suite.add_argument('--max-estimate', type=float, default=5.0,
+                       help="Skip backend cases estimated to take longer than this (seconds)")
+    suite.add_argument('--save', metavar='JSON', help="Write the results as a baseline file")
+    suite.add_argument('--compare', metavar='JSON', help="Compare with a baseline; exit 1 on regression")
+    suite.add_argument('--threshold', type=float, default=0.15,
+                       help="Allowed slowdown before a case counts as a regression (default: 0.15)")
+    suite.add_argument('--noise-floor', type=float, default=NOISE_FLOOR_S * 1000, metavar='MS',
+                       help="Slowdowns below this many milliseconds never count as a regression "
+                            f"(default: {NOISE_FLOOR_S * 1000:g})")
+
+    args = parser.parse_args()
+    if args.command == 'suite':
+        sys.exit(bench_suite(args))
+    elif args.command == 'box':
+        bench_box(args.sizes, args.radii, args.repeat)
+    elif args.command == 'scaling':
+        bench_scaling(args.sizes, args.kernel_sizes, args.threads, args.repeat)
+    elif args.command == 'backends':
+        bench_backends(args.sizes, args.kernel_sizes, args.calibrate)
+    elif args.command == 'engine':
+        bench_engine(args.sizes, args.legacy_max_pixels)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,19 @@ files_to_keep = [
     'filters.py',
     'image_utils.py',
     'kernel_editor.py',
+    'convolution.py',
+    'benchmark.py',
+    'worker.py',
+    'result_cache.py',
+    'batch.py',
+    'tiled.py',
+    'parallel.py',
+    'integral.py',
+    'profiling.py',
+    'kernels.py',
+    'streaming.py',
+    'pipeline.py',
+    'image_loader.py',
     'requirements.txt',
     'README.md',
     'cleanup.py',  # Keep this script
@@ -0,0 +1,834 @@
+import functools
+import time
+from itertools import chain
+import numpy as np
+
+from integral import correlate_box
+
+# Largest deviation (in gray levels of an 8-bit image) that a low-rank
+# factorization may introduce before the dense kernel is used instead
+SEPARABLE_TOLERANCE = 0.5
+
+def normalization_divisor(kernel):
+    """Divisor applied to blur kernels (sum > 1), 1 for everything else"""
+    kernel_sum = float(np.sum(kernel))
+    return kernel_sum if kernel_sum > 1 else 1.0
+
+def normalize_kernel(kernel):
+    """Normalize the kernel if it's a blur kernel (sum > 1)"""
+    return np.asarray(kernel, dtype=float) / normalization_divisor(kernel)
+
+def is_integer_kernel(kernel):
+    """True if every kernel weight is a whole number"""
+    kernel = np.asarray(kernel)
+    return np.issubdtype(kernel.dtype, np.integer) or bool(np.all(kernel == np.round(kernel)))
+
+def is_constant_kernel(kernel):
+    """True if every weight is the same nonzero value (a box kernel)"""
+    kernel = np.asarray(kernel)
+    return kernel.size > 0 and kernel.flat[0] != 0 and bool(np.all(kernel == kernel.flat[0]))
+
+def accumulator_dtype(image, kernel):
+    """Smallest integer type that holds any sum of an integer image and kernel"""
+    image_max = np.iinfo(image.dtype).max if np.issubdtype(image.dtype, np.integer) else None
+    if image_max is None or image.dtype.itemsize > 2:
+        return np.int64
+    bound = image_max * int(np.sum(np.abs(kernel)))
+    return np.int32 if bound < 2 ** 31 else np.int64
+
+def _buffer(workspace, name, shape, dtype, zero=False):
+    """A buffer from workspace, or a new array without one"""
+    if workspace is None:
+        return np.zeros(shape, dtype) if zero else np.empty(shape, dtype)
+    buffer = workspace.buffer(name, shape, dtype)
+    if zero:
+        buffer.fill(0)
+    return buffer
+
+def _accumulate(output, image_slice, weight, scratch, dtype):
+    """output += weight * image_slice, computed in dtype"""
+    if weight == 1:
+        np.add(output, image_slice, out=output, dtype=dtype)
+    elif weight == -1:
+        np.subtract(output, image_slice, out=output, dtype=dtype)
+    else:
+        np.multiply(image_slice, weight, out=scratch, dtype=dtype)
+        output += scratch
+
+def correlate_valid(image, kernel, dtype=float, workspace=None):
+    """Correlate an array with a kernel where the kernel fits entirely
+
+    The whole output is built with one multiply-add per kernel tap over
+    shifted slices of the image, instead of one Python iteration per pixel.
+
+    Args:
+        image: 2D array (or 3D with a trailing channel axis)
+        kernel: 2D array of weights (used as-is, no normalization)
+        dtype: Accumulator type; an integer type gives exact sums for
+            integer kernels
+        workspace: Workspace to take the output and scratch arrays from
+            (the output is then the workspace's 'accumulator' buffer)
+
+    Returns:
+        Array of shape (H - kh + 1, W - kw + 1) in dtype
+    """
+    height, width = image.shape[:2]
+    k_height, k_width = kernel.shape
+    out_h = height - k_height + 1
+    out_w = width - k_width + 1
+    if out_h <= 0 or out_w <= 0:
+        return np.zeros((max(out_h, 0), max(out_w, 0)) + image.shape[2:], dtype=dtype)
+
+    output = _buffer(workspace, 'accumulator', (out_h, out_w) + image.shape[2:], dtype, zero=True)
+    scratch = _buffer(workspace, 'scratch', output.shape, dtype)
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        kernel = kernel.astype(dtype)
+
+    for row in range(k_height):
+        for col in range(k_width):
+            weight = kernel[row, col]
+            if weight == 0:
+                continue
+            _accumulate(output, image[row:row + out_h, col:col + out_w], weight, scratch, dtype)
+
+    return output
+
+@functools.lru_cache(maxsize=256)
+def _factorize(shape, data, tolerance):
+    kernel = np.frombuffer(data, dtype=float).reshape(shape)
+    dense_cost = np.count_nonzero(kernel)
+    divisor = normalization_divisor(kernel)
+
+    u, s, vt = np.linalg.svd(kernel)
+    for rank in range(1, len(s) + 1):
+        columns = u[:, :rank] * np.sqrt(s[:rank])
+        rows = vt[:rank].T * np.sqrt(s[:rank])
+        # r pairs of 1D passes cost one tap per nonzero factor weight
+        if np.count_nonzero(columns) + np.count_nonzero(rows) >= dense_cost:
+            return None
+        worst_error = 255 * np.sum(np.abs(columns @ rows.T - kernel))
+        if worst_error / divisor <= tolerance:
+            pairs = tuple((columns[:, i].copy(), rows[:, i].copy()) for i in range(rank))
+            return pairs, worst_error
+    return None
+
+def separable_factors(kernel, tolerance=SEPARABLE_TOLERANCE):
+    """Factor a kernel into rank-1 (column, row) pairs with an SVD
+
+    The lowest rank whose result stays within `tolerance` gray levels of
+    the dense kernel is used. Factorizations are cached per kernel, so each
+    preset is only decomposed once.
+
+    Returns:
+        Tuple of (column_vector, row_vector) pairs whose outer products sum
+        to (approximately) the kernel, or None when the dense kernel is cheaper
+    """
+    kernel = np.ascontiguousarray(kernel, dtype=float)
+    if kernel.ndim != 2:
+        return None
+    factorization = _factorize(kernel.shape, kernel.tobytes(), tolerance)
+    return None if factorization is None else factorization[0]
+
+def integer_factors(kernel):
+    """Exact integer (column, row) factors of a rank-1 integer kernel, or None
+
+    E.g. box blur = ones x ones and Sobel X = [1, 1, 2, 1, 1] x [2, 1, 0, -1, -2].
+    """
+    kernel = np.asarray(kernel)
+    if not is_integer_kernel(kernel) or not np.any(kernel):
+        return None
+    kernel = kernel.astype(np.int64)
+    pivot_row = np.flatnonzero(np.any(kernel != 0, axis=1))[0]
+    row_vector = kernel[pivot_row] // np.gcd.reduce(kernel[pivot_row])
+    pivot_col = np.flatnonzero(row_vector)[0]
+    column_vector = kernel[:, pivot_col] // row_vector[pivot_col]
+    if not np.array_equal(np.outer(column_vector, row_vector), kernel):
+        return None
+    return ((column_vector, row_vector),)
+
+def kernel_properties(kernel):
+    """(weights, is_integer, divisor) of a kernel array or kernels.Kernel
+
+    weights are int64 for integer kernels and float otherwise. A Kernel's
+    precomputed values are used as they are; for arrays they are derived here.
+    """
+    if hasattr(kernel, 'is_integer'):
+        return kernel.weights, kernel.is_integer, kernel.divisor
+    kernel = np.asarray(kernel)
+    integer = is_integer_kernel(kernel)
+    return kernel.astype(np.int64 if integer else float), integer, normalization_divisor(kernel)
+
+def kernel_factors(kernel, integer):
+    """integer_factors (integer=True) or separable_factors of a kernel, precomputed for a kernels.Kernel"""
+    if hasattr(kernel, 'is_integer'):
+        return kernel.integer_factors if integer else kernel.factors
+    return integer_factors(kernel) if integer else separable_factors(kernel)
+
+def correlate_separable(image, factors, dtype=float, workspace=None):
+    """Correlate an array with a low-rank kernel given as (column, row) pairs
+
+    Each pair is applied as a 1D pass along the rows followed by a 1D pass
+    along the columns; the passes for all pairs are summed. Buffers come
+    from workspace if given, as in correlate_valid.
+
+    Returns:
+        Array of shape (H - kh + 1, W - kw + 1) in dtype
+    """
+    height, width = image.shape[:2]
+    k_height, k_width = len(factors[0][0]), len(factors[0][1])
+    out_h = height - k_height + 1
+    out_w = width - k_width + 1
+    if out_h <= 0 or out_w <= 0:
+        return np.zeros((max(out_h, 0), max(out_w, 0)) + image.shape[2:], dtype=dtype)
+
+    output = _buffer(workspace, 'accumulator', (out_h, out_w) + image.shape[2:], dtype, zero=True)
+    rows_pass = _buffer(workspace, 'rows', (height, out_w) + image.shape[2:], dtype)
+    scratch = _buffer(workspace, 'rows_scratch', rows_pass.shape, dtype)
+
+    for column_vector, row_vector in factors:
+        rows_pass.fill(0)
+        for col, weight in enumerate(row_vector):
+            if weight == 0:
+                continue
+            _accumulate(rows_pass, image[:, col:col + out_w], weight, scratch, dtype)
+        for row, weight in enumerate(column_vector):
+            if weight == 0:
+                continue
+            _accumulate(output, rows_pass[row:row + out_h], weight, scratch[:out_h], dtype)
+
+    return output
+
+def _next_fast_len(n):
+    """Smallest 2-3-5 smooth integer >= n (sizes numpy.fft handles fastest)"""
+    best = 1
+    while best < n:
+        best *= 2
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            candidate = p35
+            while candidate < n:
+                candidate *= 2
+            best = min(best, candidate)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+def correlate_fft(image, kernel):
+    """Correlate an array with a kernel through numpy.fft (rfft2/irfft2)
+
+    Both operands are zero padded to fast transform sizes, so the cost grows
+    with the image size rather than with the kernel area.
+
+    Returns:
+        Float array of shape (H - kh + 1, W - kw + 1)
+    """
+    height, width = image.shape[:2]
+    k_height, k_width = kernel.shape
+    out_h = height - k_height + 1
+    out_w = width - k_width + 1
+    if out_h <= 0 or out_w <= 0:
+        return np.zeros((max(out_h, 0), max(out_w, 0)) + image.shape[2:])
+
+    # Only the valid part of the (circular) result is kept, so padding to the
+    # image size is enough to keep wrapped-around products out of it
+    shape = (_next_fast_len(height), _next_fast_len(width))
+    image_spectrum = np.fft.rfft2(image, shape, axes=(0, 1))
+    # Correlation is convolution with the flipped kernel
+    kernel_spectrum = np.fft.rfft2(kernel[::-1, ::-1], shape)
+    kernel_spectrum = kernel_spectrum.reshape(kernel_spectrum.shape + (1,) * (image.ndim - 2))
+    full = np.fft.irfft2(image_spectrum * kernel_spectrum, shape, axes=(0, 1))
+
+    return full[k_height - 1:k_height - 1 + out_h, k_width - 1:k_width - 1 + out_w]
+
+class CostModel:
+    """Estimates the run time of each convolution backend
+
+    Each backend's cost is a coefficient (seconds per unit of work) times
+    its amount of work:
+        direct:    output pixels * nonzero kernel taps
+        separable: output pixels * nonzero taps of the 1D factors
+        fft:       P * log2(P) for the padded transform size P
+        box:       image pixels + output pixels (summed-area table, then
+                   four lookups per output pixel; constant kernels only)
+    The coefficients default to values measured on a typical laptop and can
+    be refit to the current machine with calibrate().
+    """
+    def __init__(self, direct=2.3e-9, separable=2.3e-9, fft=3e-9, fft_overhead=3e-4, box=2.5e-8):
+        self.direct = direct
+        self.separable = separable
+        self.fft = fft
+        self.fft_overhead = fft_overhead
+        self.box = box
+
+    def work(self, backend, image_shape, kernel):
+        """Amount of work (in the backend's own units) for one 2D plane"""
+        height, width = image_shape[:2]
+        k_height, k_width = kernel.shape
+        out_pixels = max(height - k_height + 1, 0) * max(width - k_width + 1, 0)
+        if backend == 'direct':
+            return out_pixels * np.count_nonzero(kernel)
+        if backend == 'separable':
+            factors = separable_factors(kernel)
+            if factors is None:
+                return None
+            taps = sum(np.count_nonzero(c) + np.count_nonzero(r) for c, r in factors)
+            return out_pixels * taps
+        if backend == 'fft':
+            padded = _next_fast_len(height) * _next_fast_len(width)
+            return padded * np.log2(max(padded, 2))
+        if backend == 'box':
+            if not is_constant_kernel(kernel):
+                return None
+            return height * width + out_pixels
+        raise ValueError(f"Unknown backend: {backend}")
+
+    def estimate(self, backend, image_shape, kernel):
+        """Estimated seconds for a backend, or None if it can't run this kernel"""
+        work = self.work(backend, image_shape, kernel)
+        if work is None:
+            return None
+        channels = int(np.prod(image_shape[2:]))
+        if backend == 'fft':
+            return (self.fft * work + self.fft_overhead) * channels
+        return getattr(self, backend) * work * channels
+
+    def calibrate(self, size=(512, 512), kernel_size=9, repeat=3):
+        """Refit the coefficients by timing each backend on a random image"""
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, size=size).astype(np.uint8)
+        dense = rng.integers(-5, 6, size=(kernel_size, kernel_size)).astype(float)
+        dense[dense == 0] = 1
+        separable = np.outer(np.arange(1, kernel_size + 1), np.ones(kernel_size))
+        constant = np.ones((kernel_size, kernel_size))
+
+        def best_time(func, *args):
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func(*args)
+                best = min(best, time.perf_counter() - start)
+            return best
+
+        self.direct = best_time(correlate_valid, image, dense) / self.work('direct', size, dense)
+        self.separable = (best_time(correlate_separable, image, separable_factors(separable))
+                          / self.work('separable', size, separable))
+        self.fft_overhead = best_time(correlate_fft, image[:8, :8], dense[:3, :3])
+        fft_time = best_time(correlate_fft, image, dense) - self.fft_overhead
+        self.fft = max(fft_time, 0) / self.work('fft', size, dense)
+        self.box = (best_time(correlate_box, image, 1, kernel_size, kernel_size)
+                    / self.work('box', size, constant))
+        return self
+
+# Cost model used by convolve2d when no backend is forced
+DEFAULT_COST_MODEL = CostModel()
+
+BACKENDS = ('direct', 'separable', 'fft', 'box')
+
+def select_backend(image_shape, kernel, cost_model=None):
+    """Pick the cheapest backend for an image shape and kernel"""
+    cost_model = cost_model or DEFAULT_COST_MODEL
+    kernel = np.asarray(kernel, dtype=float)
+    estimates = {}
+    for backend in BACKENDS:
+        estimate = cost_model.estimate(backend, image_shape, kernel)
+        if estimate is not None:
+            estimates[backend] = estimate
+    return min(estimates, key=estimates.get)
+
+def band_backend(image_shape, kernel, cost_model=None, dtype=np.uint8):
+    """Backend for filtering an image in row bands, chosen once from the full image shape
+
+    Integer kernels on integer images give exact results on every backend.
+    Otherwise the FFT (whose rounding depends on the transform size) and, on
+    float images, the summed-area table (whose rounding depends on where the
+    table starts) are replaced by a spatial backend, whose per-pixel
+    arithmetic doesn't depend on the band, so the banded output is the same
+    for any band split.
+    """
+    backend = select_backend(image_shape, kernel, cost_model)
+    exact = is_integer_kernel(kernel) and np.issubdtype(dtype, np.integer)
+    if ((backend == 'fft' and not exact)
+            or (backend == 'box' and not np.issubdtype(dtype, np.integer))):
+        backend = 'separable' if separable_factors(kernel) is not None else 'direct'
+    return backend
+
+def _correlate_box(image, kernel, dtype, workspace=None):
+    """correlate_box for a kernel array (ValueError unless it is constant)"""
+    if not is_constant_kernel(kernel):
+        raise ValueError("The box backend needs a constant kernel")
+    k_height, k_width = kernel.shape
+    return correlate_box(image, kernel.flat[0], k_height, k_width, dtype, workspace)
+
+def correlate_float(image, kernel, backend, exact, workspace=None):
+    """Float sums of a backend where the kernel fits entirely
+
+    Shared by convolve2d and filter_valid's float path.
+
+    Args:
+        image: Array of shape (H, W) or (H, W, C)
+        kernel: 2D float array of weights
+        backend: 'direct', 'separable', 'fft' or 'box'
+        exact: True if the sums are whole numbers (integer image and
+            kernel), so the SVD/FFT rounding error can be snapped away
+        workspace: Workspace to take the buffers from, as in correlate_valid
+
+    Returns:
+        Float array of shape (H - kh + 1, W - kw + 1[, C])
+    """
+    if backend == 'direct':
+        valid = correlate_valid(image, kernel, float, workspace)
+    elif backend == 'separable':
+        factorization = _factorize(kernel.shape, np.ascontiguousarray(kernel).tobytes(),
+                                   SEPARABLE_TOLERANCE)
+        if factorization is None:
+            raise ValueError("Kernel has no separable factorization within tolerance")
+        factors, worst_error = factorization
+        valid = correlate_separable(image, factors, float, workspace)
+        exact = exact and worst_error < 0.5
+    elif backend == 'fft':
+        valid = correlate_fft(image, kernel)
+    elif backend == 'box':
+        valid = _correlate_box(image, kernel, float, workspace)
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    if exact and backend != 'direct':
+        # Integer sums are exact; snap away the SVD/FFT rounding error
+        np.rint(valid, out=valid)
+    return valid
+
+def convolve2d(image, kernel, backend='auto', cost_model=None, divisor=None):
+    """Apply a kernel to a 2D array, normalizing blur kernels (sum > 1)
+
+    The raw kernel is accumulated and the normalization divisor is applied
+    once at the end, so integer kernels on integer images give exact sums.
+    Pixels closer to the border than half the kernel size are left at 0,
+    like the original per-pixel loop, whatever backend is used.
+
+    Args:
+        image: 2D array
+        kernel: 2D array of weights
+        backend: 'direct', 'separable', 'fft', 'box' or 'auto' to let the
+            cost model choose (low-rank kernels such as Sobel usually go
+            separable, constant kernels through a summed-area table, large
+            kernels on big images through the FFT)
+        cost_model: CostModel used by 'auto' (DEFAULT_COST_MODEL if None)
+        divisor: Normalization divisor to use instead of the blur rule
+            (e.g. for kernels fused from several normalized stages)
+    """
+    kernel = np.asarray(kernel, dtype=float)
+    k_height, k_width = kernel.shape
+    pad_h = k_height // 2
+    pad_w = k_width // 2
+
+    if backend == 'auto':
+        backend = select_backend(image.shape, kernel, cost_model)
+
+    output = np.zeros(image.shape, dtype=float)
+    exact = np.issubdtype(image.dtype, np.integer) and np.all(kernel == np.round(kernel))
+    valid = correlate_float(image, kernel, backend, exact)
+    output[pad_h:pad_h + valid.shape[0], pad_w:pad_w + valid.shape[1]] = valid
+
+    if divisor is None:
+        divisor = normalization_divisor(kernel)
+    if divisor != 1:
+        output /= divisor
+    return output
+
+# Rows of unfolded patches processed per matrix multiply in filter_bank
+FILTER_BANK_CHUNK_PIXELS = 1 << 16
+
+def filter_bank(image, kernels):
+    """Apply a stack of K same-sized kernels in one pass over the image
+
+    The image is unfolded once into a (pixels, kh * kw) patch matrix (in
+    chunks of rows, to bound memory) and multiplied by the (kh * kw, K)
+    kernel matrix, so all K responses come out of a single matrix multiply
+    per chunk. Each response is normalized and clipped like filter_array;
+    integer kernels give exactly the same result.
+
+    Args:
+        image: 2D array (or 3D with a trailing channel axis)
+        kernels: Sequence of K 2D kernels of the same shape (arrays or
+            kernels.Kernel, whose precomputed divisor and integer flag are
+            used), or a (K, kh, kw) array
+
+    Returns:
+        uint8 array of shape (K,) + image.shape
+    """
+    properties = [kernel_properties(kernel) for kernel in kernels]
+    kernels = np.array([weights for weights, _, _ in properties], dtype=float)
+    n_kernels, k_height, k_width = kernels.shape
+    height, width = image.shape[:2]
+    channels = image.shape[2:]
+    pad_h = k_height // 2
+    pad_w = k_width // 2
+    out_h = height - k_height + 1
+    out_w = width - k_width + 1
+
+    output = np.zeros((n_kernels,) + image.shape, dtype=np.uint8)
+    if out_h <= 0 or out_w <= 0:
+        return output
+
+    divisors = np.array([divisor for _, _, divisor in properties])
+    exact = np.issubdtype(image.dtype, np.integer) and all(integer for _, integer, _ in properties)
+    # Small integer sums are exact in float32 (with room for the rounding
+    # offset below), which halves the work
+    dtype = float
+    if exact and np.iinfo(image.dtype).max * np.abs(kernels).sum(axis=(1, 2)).max() < 2 ** 20:
+        dtype = np.float32
+    kernel_matrix = kernels.reshape(n_kernels, -1).astype(dtype)
+    inverse_divisors = (1 / divisors).astype(dtype)[:, None]
+
+    # (out_h, out_w, *channels, kh, kw) view of every patch, without copying
+    windows = np.lib.stride_tricks.sliding_window_view(image, (k_height, k_width), axis=(0, 1))
+    rows_per_chunk = max(1, FILTER_BANK_CHUNK_PIXELS // (out_w * max(1, int(np.prod(channels)))))
+
+    for top in range(0, out_h, rows_per_chunk):
+        bottom = min(top + rows_per_chunk, out_h)
+        patches = windows[top:bottom].reshape(-1, k_height * k_width).astype(dtype)
+        # (K, kh * kw) @ (kh * kw, pixels): one response row per kernel
+        responses = kernel_matrix @ patches.T
+        if exact:
+            # The sums are exact integers, so (sum + 0.5) / divisor is at
+            # least half a step away from the next integer and truncation in
+            # to_uint8 floors like the integer path (without a slow division)
+            responses += 0.5
+        responses *= inverse_divisors
+        responses = to_uint8(responses).reshape((n_kernels, bottom - top, out_w) + channels)
+        output[:, pad_h + top:pad_h + bottom, pad_w:pad_w + out_w] = responses
+
+    return output
+
+def _splat_matrix(size, factor):
+    """Linear-interpolation weights from full-resolution taps to proxy taps"""
+    half = size // 2
+    new_half = int(np.ceil(half / factor))
+    matrix = np.zeros((2 * new_half + 1, size))
+    for tap in range(size):
+        position = (tap - half) / factor + new_half
+        low = int(np.floor(position))
+        fraction = position - low
+        matrix[low, tap] += 1 - fraction
+        if fraction:
+            matrix[low + 1, tap] += fraction
+    return matrix
+
+def rescale_kernel(kernel, factor_y, factor_x=None):
+    """Adapt a kernel to an image downscaled by factor (full pixels per proxy pixel)
+
+    Each tap is split between the two nearest proxy taps by linear
+    interpolation. This keeps the kernel sum (so blur normalization and the
+    response to flat areas are unchanged) and its first moments (so edge
+    kernels respond to gradients as they do at full resolution).
+    """
+    factor_x = factor_y if factor_x is None else factor_x
+    kernel = np.asarray(kernel, dtype=float)
+    if factor_y <= 1 and factor_x <= 1:
+        return kernel
+    rows = _splat_matrix(kernel.shape[0], max(factor_y, 1))
+    cols = _splat_matrix(kernel.shape[1], max(factor_x, 1))
+    return rows @ kernel @ cols.T
+
+def to_uint8(output):
+    """Clip a float result to the displayable 0-255 range"""
+    return np.clip(output, 0, 255).astype(np.uint8)
+
+# How pixels beyond the image edge are filled: 'black' leaves output pixels
+# where the kernel doesn't fit at 0 (the original behaviour); the others pad
+# the input so every output pixel is computed
+BORDER_MODES = ('black', 'zero', 'reflect', 'replicate', 'wrap')
+# np.pad mode giving the source index of each padded row or column
+_PAD_MODES = {'reflect': 'reflect', 'replicate': 'edge', 'wrap': 'wrap'}
+
+def fill_border(padded, image, pad, border):
+    """Copy image into the middle of padded and fill its margins in place
+
+    Args:
+        padded: Array of shape (H + top + bottom, W + left + right[, C])
+        image: Array of shape (H, W[, C])
+        pad: (top, bottom, left, right) margin sizes
+        border: 'zero', 'reflect' (mirrored, without repeating the edge
+            pixel), 'replicate' (edge pixel repeated) or 'wrap' (periodic)
+
+    Returns:
+        padded
+    """
+    top, bottom, left, right = pad
+    height, width = image.shape[:2]
+    padded[top:top + height, left:left + width] = image
+    if border == 'zero':
+        padded[:top] = 0
+        padded[top + height:] = 0
+        padded[top:top + height, :left] = 0
+        padded[top:top + height, left + width:] = 0
+        return padded
+
+    rows = np.pad(np.arange(height), (top, bottom), mode=_PAD_MODES[border])
+    cols = np.pad(np.arange(width), (left, right), mode=_PAD_MODES[border])
+    # Margin columns of the image rows first, then whole margin rows, which
+    # copies the corners along with them
+    for col in chain(range(left), range(left + width, left + width + right)):
+        padded[top:top + height, col] = padded[top:top + height, left + cols[col]]
+    for row in chain(range(top), range(top + height, top + height + bottom)):
+        padded[row] = padded[top + rows[row]]
+    return padded
+
+def write_result(out, valid, pad_h, pad_w):
+    """Store a clipped result in out at (pad_h, pad_w), zeroing the band around it
+
+    Only the rows of out are touched, so callers can hand in disjoint
+    row slices of one array from several threads.
+    """
+    out_h, out_w = valid.shape[:2]
+    out[:pad_h] = 0
+    out[pad_h + out_h:] = 0
+    out[pad_h:pad_h + out_h, :pad_w] = 0
+    out[pad_h:pad_h + out_h, pad_w + out_w:] = 0
+    # Truncates float results like astype(np.uint8)
+    np.copyto(out[pad_h:pad_h + out_h, pad_w:pad_w + out_w], valid, casting='unsafe')
+    return out
+
+class Workspace:
+    """Buffers reused across filter calls, e.g. while a kernel is edited
+
+    Holds the padded input, accumulator, scratch arrays and normalization
+    temporaries by name. A buffer is only reallocated when a call needs
+    more elements than it holds or another dtype (a larger image or kernel,
+    another accumulator type), so repeated filtering of one image allocates
+    nothing proportional to its size, apart from a fresh output when no
+    out= array is given and the FFT backend's spectra. Not thread-safe: use
+    one workspace per thread.
+    """
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0  # Buffers (re)allocated so far
+
+    def buffer(self, name, shape, dtype):
+        """The named buffer with this shape and dtype (contents are left over from its last use)"""
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        storage = self._buffers.get(name)
+        if storage is None or storage.dtype != dtype or storage.size < size:
+            storage = self._buffers[name] = np.empty(size, dtype)
+            self.allocations += 1
+        return storage[:size].reshape(shape)
+
+    @property
+    def nbytes(self):
+        """Memory held by the buffers"""
+        return sum(storage.nbytes for storage in self._buffers.values())
+
+    def padded(self, image, kernel_shape, border):
+        """image padded by the kernel's reach according to border, in the 'padded' buffer"""
+        k_height, k_width = kernel_shape
+        pad = (k_height // 2, k_height - 1 - k_height // 2, k_width // 2, k_width - 1 - k_width // 2)
+        shape = (image.shape[0] + k_height - 1, image.shape[1] + k_width - 1) + image.shape[2:]
+        return fill_border(self.buffer('padded', shape, image.dtype), image, pad, border)
+
+    def filter(self, image, kernel, backend='auto', cost_model=None, border='black', out=None):
+        """filter_array using this workspace's buffers (see filter_array)"""
+        if border not in BORDER_MODES:
+            raise ValueError(f"Unknown border mode: {border} (choose from {', '.join(BORDER_MODES)})")
+        if out is None:
+            out = np.empty(image.shape, dtype=np.uint8)
+        elif out.shape != image.shape or out.dtype != np.uint8:
+            raise ValueError(f"out must be a uint8 array of shape {image.shape}, got {out.dtype} {out.shape}")
+
+        weights = np.asarray(kernel)
+        k_height, k_width = weights.shape
+        if border == 'black':
+            source = image
+            pad_h, pad_w = k_height // 2, k_width // 2
+        else:
+            source = self.padded(image, weights.shape, border)
+            pad_h = pad_w = 0
+        if backend == 'auto':
+            backend = select_backend(source.shape, weights, cost_model)
+
+        # The kernel itself, so a kernels.Kernel's precomputed properties are used
+        valid = self.filter_valid(source, kernel, backend)
+        return write_result(out, valid, pad_h, pad_w)
+
+    def filter_valid(self, source, kernel, backend):
+        """Normalized result, clipped to 0-255, where the kernel fits entirely in source
+
+        Returns:
+            Array of shape (H - kh + 1, W - kw + 1[, C]) in a workspace
+            buffer (integer or float, not yet converted to uint8)
+        """
+        weights, integer_kernel, divisor = kernel_properties(kernel)
+        if backend != 'fft' and np.issubdtype(source.dtype, np.integer) and integer_kernel:
+            # Exact fixed-point sums, floor-divided like the float path truncates
+            dtype = accumulator_dtype(source, weights)
+            factors = kernel_factors(kernel, True) if backend == 'separable' else None
+            if backend == 'box':
+                valid = _correlate_box(source, weights, dtype, self)
+            elif factors is None:
+                valid = correlate_valid(source, weights, dtype, self)
+            else:
+                valid = correlate_separable(source, factors, dtype, self)
+            divisor = int(divisor)
+            if divisor != 1:
+                np.floor_divide(valid, divisor, out=valid)
+        else:
+            exact = np.issubdtype(source.dtype, np.integer) and integer_kernel
+            valid = correlate_float(source, weights.astype(float), backend, exact, self)
+            if divisor != 1:
+                valid /= divisor
+
+        # A Kernel knows whether 8-bit input can leave 0-255 at all
+        if source.dtype != np.uint8 or getattr(kernel, 'needs_clipping', True):
+            np.clip(valid, 0, 255, out=valid)
+        return valid
+
+def filter_array(image, kernel, backend='auto', cost_model=None, border='black', out=None, workspace=None):
+    """Apply a kernel to an array and return the displayable uint8 result
+
+    Integer kernels on integer images (every preset and every kernel the
+    editor can produce) run on the exact fixed-point path; float is only
+    used for non-integer weights and for the FFT backend, whose integer
+    results are snapped back to exact sums.
+
+    Args:
+        image: 2D array (or 3D with a trailing channel axis)
+        kernel: 2D array of weights, or a kernels.Kernel (whose precomputed
+            divisor and factors are used instead of being derived again)
+        backend: 'direct', 'separable', 'fft', 'box' or 'auto' to let the
+            cost model choose
+        cost_model: CostModel used by 'auto'
+        border: One of BORDER_MODES ('black' keeps the original black border)
+        out: uint8 array the shape of image to write the result into
+        workspace: Workspace whose buffers are reused for the intermediates
+            (a temporary one is used if None)
+
+    Returns:
+        uint8 array the shape of the image (out, if given)
+    """
+    return (workspace or Workspace()).filter(image, kernel, backend, cost_model, border, out)
+
+# Edits touching at most this many taps are applied as shifted adds
+INCREMENTAL_MAX_TAPS = 8
+
+class IncrementalConvolver:
+    """Re-applies edited kernels to one image without full recomputation
+
+    Convolution is linear in the kernel, so after changing a few taps the new
+    result is the old unclipped accumulator plus (delta * shifted image) for
+    each changed tap. The accumulator holds the raw, un-normalized sums, so a
+    change of the normalization divisor only rescales the output. Integer
+    sums are exact on every backend; float sums are only updated in place
+    while both the accumulator and a fresh filter_array would use the direct
+    backend (the SVD and FFT approximations differ per kernel), otherwise
+    they are rebuilt.
+
+    With a border other than 'black' the image is padded once per kernel
+    shape (in the workspace) and the sums cover every output pixel, as in
+    filter_array.
+    """
+    def __init__(self, image, border='black'):
+        if border not in BORDER_MODES:
+            raise ValueError(f"Unknown border mode: {border} (choose from {', '.join(BORDER_MODES)})")
+        self.image = image
+        self.border = border
+        self.source = image  # What the accumulator sums over: image, padded for the kernel
+        self.backend = None  # Backend the accumulator was built with
+        self.kernel = None
+        self.divisor = None  # Normalization divisor of self.kernel
+        self.accumulator = None
+        self.workspace = Workspace()  # Accumulator, scratch and result temporaries
+        self.full_updates = 0
+        self.incremental_updates = 0
+
+    def _rebuild(self, kernel, dtype, source=None):
+        """Recompute the accumulator from scratch with the backend filter_array would use
+
+        source is the kernel as passed to update (a kernels.Kernel supplies
+        precomputed factors).
+        """
+        if self.border != 'black':
+            self.source = self.workspace.padded(self.image, kernel.shape, self.border)
+        image = self.source
+        backend = self.backend = select_backend(image.shape, kernel)
+        integer = np.issubdtype(np.dtype(dtype), np.integer)
+        if backend == 'fft':
+            accumulator = correlate_fft(image, kernel)
+            if integer:
+                accumulator = np.rint(accumulator).astype(dtype)
+        elif backend == 'box':
+            accumulator = _correlate_box(image, kernel, dtype, self.workspace)
+        elif backend == 'separable':
+            factors = kernel_factors(kernel if source is None else source, integer)
+            if factors is None:
+                accumulator = correlate_valid(image, kernel, dtype, self.workspace)
+            else:
+                accumulator = correlate_separable(image, factors, dtype, self.workspace)
+        else:
+            accumulator = correlate_valid(image, kernel, dtype, self.workspace)
+        self.accumulator = accumulator
+        self.full_updates += 1
+
+    def _direct_for(self, kernel):
+        """True if the accumulator and a fresh filter_array with kernel both use the direct backend"""
+        return self.backend == 'direct' and select_backend(self.source.shape, kernel) == 'direct'
+
+    def _apply_delta(self, changed, delta):
+        """Add delta * shifted image for each changed tap"""
+        out_h, out_w = self.accumulator.shape[:2]
+        scratch = self.workspace.buffer('scratch', self.accumulator.shape, self.accumulator.dtype)
+        for row, col in zip(*changed):
+            _accumulate(self.accumulator, self.source[row:row + out_h, col:col + out_w],
+                        delta[row, col], scratch, self.accumulator.dtype)
+        self.incremental_updates += 1
+
+    def update(self, kernel, out=None):
+        """Bring the accumulator up to date with kernel
+
+        Returns:
+            uint8 array the shape of the image, equal to
+            filter_array(image, kernel, border=border) (written into out, if given)
+        """
+        source = kernel
+        kernel, integer_kernel, self.divisor = kernel_properties(kernel)
+        integer = np.issubdtype(self.image.dtype, np.integer) and integer_kernel
+        if not integer:
+            kernel = kernel.astype(float)
+        dtype = accumulator_dtype(self.image, kernel) if integer else np.float64
+
+        if (self.kernel is None or self.kernel.shape != kernel.shape
+                or self.accumulator.dtype != dtype):
+            self._rebuild(kernel, dtype, source)
+        else:
+            delta = kernel - self.kernel
+            changed = np.nonzero(delta)
+            n_changed = len(changed[0])
+            if (n_changed > min(INCREMENTAL_MAX_TAPS, np.count_nonzero(kernel))
+                    or (n_changed and not integer and not self._direct_for(kernel))):
+                self._rebuild(kernel, dtype, source)
+            elif n_changed:
+                self._apply_delta(changed, delta)
+        self.kernel = kernel
+        return self.result(out)
+
+    def result(self, out=None):
+        """Normalized, clipped uint8 output for the current accumulator
+
+        The accumulator is left untouched; the normalization happens in a
+        workspace buffer, so only the output (unless out is given) is new.
+        """
+        k_height, k_width = self.kernel.shape
+        if out is None:
+            out = np.empty(self.image.shape, dtype=np.uint8)
+
+        valid = self.workspace.buffer('result', self.accumulator.shape, self.accumulator.dtype)
+        if np.issubdtype(valid.dtype, np.integer):
+            np.floor_divide(self.accumulator, int(self.divisor), out=valid)
+        else:
+            np.divide(self.accumulator, self.divisor, out=valid)
+        np.clip(valid, 0, 255, out=valid)
+        if self.border != 'black':
+            return write_result(out, valid, 0, 0)
+        return write_result(out, valid, k_height // 2, k_width // 2)
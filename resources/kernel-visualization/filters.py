@@ -148,4 +148,9 @@ class KernelFilters:
             [0, 0, 1, 0, 0],
             [0, 0, 0, 1, 0],
             [0, 0, 0, 0, 1]
-        ])
\ No newline at end of file
+        ])
+
+def all_presets():
+    """All KernelFilters presets as {name: kernel}, in definition order"""
+    return {name: getattr(KernelFilters, name)()
+            for name in vars(KernelFilters) if not name.startswith('_')}
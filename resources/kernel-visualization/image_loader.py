@@ -0,0 +1,175 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+from image_utils import image_cache_dir, save_npy
+from profiling import span
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024  # Disk budget of the decoded-array cache
+PREFETCH_DISTANCE = 1  # Images decoded ahead on each side of the current one
+
+class ArrayCache:
+    """Decoded image arrays stored on disk as .npy files, memory-mapped on load
+
+    Entries are keyed by the file's absolute path, modification time and
+    size (plus how it was decoded), so a changed file is simply decoded
+    again. When the cache grows over max_bytes the least recently used
+    entries are deleted.
+    """
+    def __init__(self, directory=None, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = directory or os.path.join(image_cache_dir(), 'arrays')
+        self.max_bytes = max_bytes
+
+    def entry_path(self, path, variant):
+        """Cache file for path decoded as variant (raises OSError if path is missing)"""
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{variant}"
+        return os.path.join(self.directory, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '.npy')
+
+    def get(self, path, variant=None):
+        """The cached array for path as a read-only memmap, or None"""
+        try:
+            entry = self.entry_path(path, variant)
+            array = np.load(entry, mmap_mode='r')
+            os.utime(entry)  # Mark as recently used
+            return array
+        except (OSError, ValueError):
+            return None
+
+    def put(self, path, variant, array):
+        """Store the decoded array of path, then trim the cache to max_bytes"""
+        try:
+            entry = self.entry_path(path, variant)
+            os.makedirs(self.directory, exist_ok=True)
+            save_npy(entry, array)
+            self.trim()
+        except OSError as e:
+            print(f"Error caching decoded {path}: {e}")
+
+    def trim(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith('.npy'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+                total -= size
+            except OSError:
+                pass
+
+def has_alpha(image):
+    """True if a PIL image carries transparency"""
+    return image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+
+def load_image(path, mode=None, draft_size=None, cache=None):
+    """Decode an image file, or load its decoded array from the cache
+
+    Args:
+        path: Image file
+        mode: 'L', 'RGB' or 'RGBA'; None for RGB, or RGBA if the image has
+            transparency
+        draft_size: (width, height) if only a preview of this size is
+            needed: JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 scale
+            that still covers it (PIL draft mode), and the result is
+            shrunk to fit
+        cache: ArrayCache to read from and store into (None to always decode)
+
+    Returns:
+        PIL image in the requested mode
+    """
+    variant = (mode, draft_size)
+    if cache is not None:
+        array = cache.get(path, variant)
+        if array is not None:
+            return Image.fromarray(array)
+
+    with span('decode'), Image.open(path) as image:
+        target = mode or ('RGBA' if has_alpha(image) else 'RGB')
+        if draft_size:
+            # A no-op for formats other than JPEG
+            image.draft('L' if target == 'L' else 'RGB', draft_size)
+        image = image.convert(target)
+        if draft_size:
+            image.thumbnail(draft_size)
+
+    if cache is not None:
+        cache.put(path, variant, np.asarray(image))
+    return image
+
+def image_files(directory):
+    """Image files of a directory, sorted by name"""
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+class ImageBrowser:
+    """Steps through the images of a directory, decoding on background threads
+
+    Each image is decoded twice: as a preview (draft-decoded and shrunk to
+    preview_size, for display) and at full resolution (for processing).
+    The preview is decoded first, so it can be shown while the full image
+    is still being decoded. The images PREFETCH_DISTANCE steps either side
+    of the current one are decoded ahead, so stepping to them is instant.
+    Decoded arrays also go through an ArrayCache, so images seen before (in
+    this or an earlier run) skip decoding.
+    """
+    def __init__(self, path, preview_size=(256, 256), cache=None, workers=2):
+        directory = path if os.path.isdir(path) else os.path.dirname(path) or '.'
+        self.files = image_files(directory)
+        if not self.files:
+            raise ValueError(f"No images in {directory}")
+        self.index = 0
+        if not os.path.isdir(path):
+            self.index = self.files.index(os.path.join(directory, os.path.basename(path)))
+        self.preview_size = preview_size
+        self.cache = ArrayCache() if cache is None else cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-prefetch")
+        self._images = {}  # path -> (preview, image) futures of the current and prefetched images
+
+    @property
+    def path(self):
+        return self.files[self.index]
+
+    def _load(self, path):
+        futures = self._images.get(path)
+        if futures is None:
+            futures = self._images[path] = (
+                self._executor.submit(load_image, path, None, self.preview_size, self.cache),
+                self._executor.submit(load_image, path, None, None, self.cache))
+        return futures
+
+    def request(self):
+        """Futures (preview, image) of the current image; its neighbours are prefetched"""
+        futures = self._load(self.path)
+
+        # Decode the neighbours next, and forget images that are now out of reach
+        wanted = {self.path}
+        for distance in range(1, PREFETCH_DISTANCE + 1):
+            for index in (self.index + distance, self.index - distance):
+                neighbour = self.files[index % len(self.files)]
+                wanted.add(neighbour)
+                self._load(neighbour)
+        for path in list(self._images):
+            if path not in wanted:
+                for future in self._images.pop(path):
+                    future.cancel()
+        return futures
+
+    def step(self, delta):
+        """Move delta images forward (negative: back), wrapping around; see request()"""
+        self.index = (self.index + delta) % len(self.files)
+        return self.request()
+
+    def close(self):
+        """Stop decoding (images already being decoded are finished and dropped)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._images.clear()
@@ -1,10 +1,13 @@
 import os
-import pygame
 import numpy as np
-from PIL import Image, ImageDraw, ImageOps
+from PIL import Image, ImageOps
+from convolution import filter_array
+from profiling import span
 
 def create_test_image(size=(200, 200)):
     """Create a simple test image with a grid pattern"""
+    # Imported here: only needed when a built-in image isn't cached yet
+    from PIL import ImageDraw
     img = Image.new('RGB', size, color=(40, 40, 40))
     
     draw = ImageDraw.Draw(img)
@@ -32,6 +35,7 @@ def create_test_image(size=(200, 200)):
 
 def create_mario_image(size=(200, 200)):
     """Create a simple Mario-like pixel art image"""
+    from PIL import ImageDraw
     img = Image.new('RGB', size, color=(135, 206, 235))  # Sky blue background
     
     draw = ImageDraw.Draw(img)
@@ -104,17 +108,60 @@ def create_mario_image(size=(200, 200)):
     
     return img
 
+# Built-in images, drawn once and then loaded from raw .npy arrays
+BUILTIN_IMAGES = {'mario': create_mario_image, 'test': create_test_image}
+BUILTIN_CACHE_VERSION = 1  # Bump when a built-in drawing changes
+
+def image_cache_dir():
+    """Directory of the built-in image cache (under XDG_CACHE_HOME or ~/.cache)"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'kernel-visualization')
+
+def save_npy(path, array):
+    """np.save to path through a temporary file, so a concurrent reader never sees half a file"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp_path, path)
+
+def builtin_image(name, size=(200, 200), cache_dir=None):
+    """A built-in image ('mario' or 'test'), from the disk cache if possible
+    
+    On first use the image is drawn and saved as a .npy array, which later
+    runs load without drawing (or importing ImageDraw). A missing or
+    unwritable cache only costs the drawing.
+    """
+    cache_dir = image_cache_dir() if cache_dir is None else cache_dir
+    path = os.path.join(cache_dir, f"{name}-{size[0]}x{size[1]}-v{BUILTIN_CACHE_VERSION}.npy")
+    try:
+        return Image.fromarray(np.load(path))
+    except (OSError, ValueError):
+        pass
+    
+    image = BUILTIN_IMAGES[name](size)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        save_npy(path, np.asarray(image))
+    except OSError as e:
+        print(f"Error caching built-in image {name}: {e}")
+    return image
+
 def load_image_from_file():
-    """Try to load an image from the current directory"""
+    """Try to load an image from the current directory
+    
+    Decoded images are cached (see image_loader.ArrayCache), so loading the
+    same file again skips decoding.
+    """
+    from image_loader import load_image, image_files, ArrayCache
     try:
         # Try to find test_image.png first
         if os.path.exists('test_image.png'):
-            return Image.open('test_image.png')
+            return load_image('test_image.png', cache=ArrayCache())
         
-        # Try to find any image in the current directory
-        for file in os.listdir('.'):
-            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-                return Image.open(file)
+        # Otherwise take the first image in the current directory
+        files = image_files('.')
+        if files:
+            return load_image(files[0], cache=ArrayCache())
         
         # If no image found, return None
         return None
@@ -122,57 +169,100 @@ def load_image_from_file():
         print(f"Error loading image: {e}")
         return None
 
-def apply_kernel(image, kernel):
-    """Apply a kernel to an image"""
+# Processing modes accepted by apply_kernel
+COLOR_MODES = ('L', 'RGB', 'RGBA')
+IMAGE_DISPLAY_SIZE = (280, 280)  # Size the app shows images at
+
+def image_to_array(image, mode='L'):
+    """Get the array apply_kernel convolves for a processing mode"""
+    if mode not in COLOR_MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    if mode == 'L':
+        # Convert image to grayscale for simpler processing
+        with span('grayscale'):
+            return np.array(ImageOps.grayscale(image))
+    with span('to_array'):
+        return np.asarray(image.convert(mode) if image.mode != mode else image)
+
+def array_to_image(output, mode='L', alpha=None):
+    """Turn a uint8 result back into a PIL image
+    
+    Grayscale results are returned in RGB mode; alpha, if given, is
+    re-attached as the fourth channel of an RGBA result.
+    """
+    if mode == 'L':
+        return Image.fromarray(output).convert('RGB')
+    if alpha is not None:
+        return Image.fromarray(np.dstack((output, alpha)), 'RGBA')
+    return Image.fromarray(output, mode)
+
+def apply_kernel(image, kernel, mode='L', convolve_alpha=False, border='black', out=None, workspace=None,
+                 workers=1):
+    """Apply a kernel to an image
+    
+    Args:
+        image: PIL image
+        kernel: 2D array of weights
+        mode: 'L' to process a grayscale copy (the classic behaviour), 'RGB'
+            or 'RGBA' to convolve all color channels in one batched pass
+        convolve_alpha: In 'RGBA' mode, also filter the alpha channel
+            instead of passing it through unchanged
+        border: How pixels near the edge are computed (see BORDER_MODES);
+            'black' leaves them black like the original implementation
+        out: uint8 array of shape (H, W) for 'L', (H, W, 3) for 'RGB' or
+            (H, W, 4) for 'RGBA' to write the result into; it is returned
+            instead of a PIL image
+        workspace: Workspace reused across calls (e.g. one per image size),
+            so repeated calls don't reallocate the intermediate buffers
+            (ignored when workers > 1: each thread keeps its own)
+        workers: Threads to split the image's rows over (see
+            parallel.filter_parallel); None for one per CPU core
+            
+    Returns:
+        PIL image ('RGB' for 'L' and 'RGB' modes, 'RGBA' for 'RGBA' mode),
+        or out if given
+    """
     if image is None:
         return None
     
-    # Convert image to grayscale for simpler processing
-    img = ImageOps.grayscale(image)
-    img_array = np.array(img)
-    
-    # Apply convolution
-    height, width = img_array.shape
-    k_height, k_width = kernel.shape
-    
-    # Padding
-    pad_h = k_height // 2
-    pad_w = k_width // 2
-    
-    # Create output array
-    output = np.zeros_like(img_array, dtype=float)
-    
-    # Normalize the kernel if it's a blur kernel (sum > 1)
-    kernel_sum = np.sum(kernel)
-    if kernel_sum > 1:
-        normalized_kernel = kernel / kernel_sum
-    else:
-        normalized_kernel = kernel.copy()
-    
-    # Apply convolution
-    for i in range(pad_h, height - pad_h):
-        for j in range(pad_w, width - pad_w):
-            # Extract the region of interest
-            roi = img_array[i - pad_h:i + pad_h + 1, j - pad_w:j + pad_w + 1]
-            
-            # Apply normalized kernel
-            output[i, j] = np.sum(roi * normalized_kernel)
-    
-    # Normalize output
-    output = np.clip(output, 0, 255).astype(np.uint8)
-    
-    # Convert back to PIL Image and ensure it's in RGB mode
-    return Image.fromarray(output).convert('RGB')
+    img_array = image_to_array(image, mode)
+    alpha = None
+    if mode == 'RGBA' and not convolve_alpha:
+        img_array, alpha = img_array[..., :3], img_array[..., 3]
+    
+    # The color channels of an RGBA out array receive the result directly
+    target = out
+    if out is not None and alpha is not None:
+        target = out[..., :3]
+        out[..., 3] = alpha
+    
+    # Apply convolution (vectorized over the whole image, all channels at
+    # once); blur kernels (sum > 1) are normalized and the result clipped
+    with span('convolve'):
+        if workers == 1:
+            output = filter_array(img_array, kernel, border=border, out=target, workspace=workspace)
+        else:
+            from parallel import filter_parallel
+            output = filter_parallel(img_array, kernel, workers, border=border, out=target)
+    if out is not None:
+        return out
+    
+    with span('to_image'):
+        return array_to_image(output, mode, alpha)
 
 def pil_to_pygame(pil_image, size=None):
     """Convert PIL image to Pygame surface"""
+    # Imported here so that headless users of this module don't load pygame
+    import pygame
+    
     if pil_image is None:
         return None
     
     # Resize if needed
     if size:
-        display_img = pil_image.copy()
-        display_img.thumbnail(size)
+        with span('thumbnail'):
+            display_img = pil_image.copy()
+            display_img.thumbnail(size)
     else:
         display_img = pil_image
     
@@ -182,6 +272,68 @@ def pil_to_pygame(pil_image, size=None):
     
     # Convert to pygame surface
     size = display_img.size
-    data = display_img.tobytes()
+    with span('tobytes'):
+        data = display_img.tobytes()
     
-    return pygame.image.fromstring(data, size, 'RGB')
\ No newline at end of file
+    with span('fromstring'):
+        return pygame.image.fromstring(data, size, 'RGB')
+
+# Palette that makes an 8-bit surface show grayscale values as-is
+GRAY_PALETTE = [(i, i, i) for i in range(256)]
+
+def display_size(width, height, max_size):
+    """Largest size within max_size with the aspect ratio of (width, height), never enlarging"""
+    scale = min(max_size[0] / width, max_size[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+class SurfaceConverter:
+    """Turns uint8 result arrays into pygame surfaces without going through PIL
+    
+    A result that fits the requested size is wrapped as a surface sharing
+    the array's memory (no copy; the surface keeps the array alive). Larger
+    results are downscaled once, straight from that view into a display-sized
+    surface. Grayscale results need one 24-bit full-size scratch surface to
+    be scaled; it is allocated once and reused, so use one converter per
+    thread. The scaled surface itself is new on every call: the app caches
+    result surfaces and spots a new image by surface identity, so a shared
+    target would be overwritten under them.
+    """
+    def __init__(self):
+        self._scratch = None
+    
+    def to_surface(self, output, size=None):
+        """Surface showing a uint8 result array
+        
+        Args:
+            output: Array of shape (H, W) (grayscale), (H, W, 3) (RGB) or
+                (H, W, 4) (RGBA; alpha is not shown)
+            size: Maximum (width, height), or None for full size
+        
+        Returns:
+            pygame Surface
+        """
+        import pygame
+        
+        output = np.ascontiguousarray(output)
+        height, width = output.shape[:2]
+        with span('wrap'):
+            if output.ndim == 2:
+                surface = pygame.image.frombuffer(output, (width, height), 'P')
+                surface.set_palette(GRAY_PALETTE)
+            elif output.shape[2] == 4:
+                surface = pygame.image.frombuffer(output, (width, height), 'RGBX')
+            else:
+                surface = pygame.image.frombuffer(output, (width, height), 'RGB')
+        
+        scaled_size = display_size(width, height, size) if size else (width, height)
+        if scaled_size == (width, height):
+            return surface
+        
+        with span('smoothscale'):
+            # smoothscale needs 24 or 32 bits per pixel
+            if surface.get_bitsize() == 8:
+                if self._scratch is None or self._scratch.get_size() != (width, height):
+                    self._scratch = pygame.Surface((width, height), 0, 24)
+                self._scratch.blit(surface, (0, 0))
+                surface = self._scratch
+            return pygame.transform.smoothscale(surface, scaled_size)
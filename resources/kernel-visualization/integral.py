@@ -0,0 +1,106 @@
+import numpy as np
+
+def table_dtype(image):
+    """int64 for integer images (exact for any image size), float64 otherwise"""
+    if np.issubdtype(image.dtype, np.integer) or image.dtype == bool:
+        return np.int64
+    return np.float64
+
+def summed_area_table(image, out=None):
+    """Summed-area table (integral image) of an array
+
+    table[y, x] is the sum of image[:y, :x], so the table has one extra
+    leading row and column of zeros and any rectangle sum takes four
+    lookups (see rect_sums). Integer images are summed in int64: 8-bit
+    images up to 2^55 pixels can't overflow.
+
+    Args:
+        image: Array of shape (H, W) or (H, W, C)
+        out: Array of shape (H + 1, W + 1[, C]) and dtype table_dtype(image)
+            to build the table in
+
+    Returns:
+        The table (out, if given)
+    """
+    height, width = image.shape[:2]
+    dtype = table_dtype(image)
+    if out is None:
+        out = np.empty((height + 1, width + 1) + image.shape[2:], dtype=dtype)
+    out[0] = 0
+    out[1:, 0] = 0
+    # Down the columns one whole row at a time: much faster than a strided
+    # cumsum along axis 0, and the image is widened to the table dtype on the fly
+    for row in range(height):
+        np.add(out[row, 1:], image[row], out=out[row + 1, 1:])
+    body = out[1:, 1:]
+    np.cumsum(body, axis=1, out=body)
+    return out
+
+def box_sums(table, height, width, out=None):
+    """Sums of every height x width window that fits in the table's image
+
+    Four shifted views of the table combined in three vectorized passes, so
+    the cost per pixel is the same for any window size.
+
+    Args:
+        table: Summed-area table of an (H, W[, C]) image
+        height, width: Window size
+        out: Array of shape (H - height + 1, W - width + 1[, C]) to write into
+
+    Returns:
+        Window sums, indexed by the window's top-left pixel (out, if given)
+    """
+    rows = table.shape[0] - height
+    cols = table.shape[1] - width
+    if out is None:
+        out = np.empty((max(rows, 0), max(cols, 0)) + table.shape[2:], dtype=table.dtype)
+    if rows <= 0 or cols <= 0:
+        return out
+    np.subtract(table[height:, width:], table[:rows, width:], out=out)
+    np.subtract(out, table[height:, :cols], out=out)
+    np.add(out, table[:rows, :cols], out=out)
+    return out
+
+def rect_sums(table, top, left, bottom, right):
+    """Sums of image[top:bottom, left:right] for (arrays of) rectangle bounds
+
+    The building block of rectangle features (e.g. Haar-like features are
+    differences of adjacent rect_sums). Bounds broadcast against each other,
+    so many rectangles are summed in one call.
+    """
+    return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+def correlate_box(image, weight, height, width, dtype=None, workspace=None):
+    """Correlate an image with a constant height x width kernel of weight
+
+    Same result as correlate_valid with np.full((height, width), weight),
+    at a cost that doesn't grow with the kernel size.
+
+    Args:
+        image: Array of shape (H, W) or (H, W, C)
+        weight: The kernel's single weight
+        height, width: Kernel size
+        dtype: Result dtype (default: the table's dtype)
+        workspace: convolution.Workspace to take the table, window sums and
+            result from ('table', 'box_sums' and 'accumulator' buffers)
+
+    Returns:
+        Array of shape (H - height + 1, W - width + 1[, C])
+    """
+    sums_dtype = table_dtype(image)
+    dtype = np.dtype(dtype or sums_dtype)
+    table_shape = (image.shape[0] + 1, image.shape[1] + 1) + image.shape[2:]
+    out_shape = (max(image.shape[0] - height + 1, 0), max(image.shape[1] - width + 1, 0)) + image.shape[2:]
+    if workspace is None:
+        table = summed_area_table(image)
+        sums = box_sums(table, height, width)
+        output = sums if dtype == sums_dtype else np.empty(out_shape, dtype=dtype)
+    else:
+        table = summed_area_table(image, workspace.buffer('table', table_shape, sums_dtype))
+        output = workspace.buffer('accumulator', out_shape, dtype)
+        sums = output if dtype == sums_dtype else workspace.buffer('box_sums', out_shape, sums_dtype)
+        box_sums(table, height, width, sums)
+    if weight != 1 or output is not sums:
+        # The sums fit in dtype whenever the weighted sums do (see accumulator_dtype)
+        np.multiply(sums, weight, out=output, casting='unsafe')
+    return output
@@ -1,89 +1,123 @@
 import pygame
 import numpy as np
-from ui import GRID_BG, ACCENT_BLUE, POSITIVE_VALUE, NEGATIVE_VALUE, ZERO_VALUE, TEXT_COLOR
+from ui import GRID_BG, ACCENT_BLUE, ZERO_VALUE, TEXT_COLOR, render_text
+from kernels import Kernel
+
+# Cells at least this large (in pixels) get their value printed
+LABEL_MIN_CELL_SIZE = 24
+# Cells at least this large are separated by grid lines
+GRID_LINE_MIN_CELL_SIZE = 4
+
+def kernel_colors(kernel):
+    """Cell colors of a kernel as a (rows, cols, 3) uint8 array
+    
+    Positive values are teal and negative values pink, brighter with the
+    magnitude; zeros are dark gray.
+    """
+    intensity = np.minimum(255, (np.abs(kernel) * 50).astype(int))
+    colors = np.empty(kernel.shape + (3,), dtype=np.uint8)
+    colors[:] = ZERO_VALUE
+    positive = kernel > 0
+    negative = kernel < 0
+    colors[positive] = np.stack([np.zeros_like(intensity), 230 - intensity // 2,
+                                 180 + intensity // 4], axis=-1)[positive]
+    colors[negative] = np.stack([np.full_like(intensity, 255), 60 + intensity // 4,
+                                 100 + intensity // 2], axis=-1)[negative]
+    return colors
 
 class KernelEditor:
-    def __init__(self, size=5, cell_size=50, padding=20):
+    def __init__(self, size=5, cell_size=50, padding=20, max_grid_extent=None):
         self.grid_size = size
-        self.cell_size = cell_size
+        self.max_cell_size = cell_size
+        # Cells shrink so larger kernels fit in this many pixels
+        self.max_grid_extent = max_grid_extent or size * cell_size
         self.padding = padding
         self.kernel = np.zeros((size, size))
+        # Kernel the grid was set from, until a cell is edited
+        self.preset = None
+        
+        # Rendered grid, rebuilt only when the kernel or cell size changes
+        self._grid_surface = None
+        self._grid_key = None
         
         # Set center cell to 1 (identity kernel)
         center = size // 2
         self.kernel[center, center] = 1
     
+    @property
+    def cell_size(self):
+        """Cell size in pixels, as large as fits the grid extent"""
+        return max(1, min(self.max_cell_size, self.max_grid_extent // self.grid_size))
+    
     def reset(self):
         """Reset to identity kernel"""
         self.kernel = np.zeros((self.grid_size, self.grid_size))
+        self.preset = None
         center = self.grid_size // 2
         self.kernel[center, center] = 1
     
     def set_kernel(self, new_kernel):
-        """Set the kernel to a new value"""
-        if new_kernel.shape != self.kernel.shape:
-            # Resize the kernel if needed
-            self.grid_size = new_kernel.shape[0]
-            self.kernel = new_kernel.copy()
-        else:
-            self.kernel = new_kernel.copy()
+        """Set the kernel to a new value (an array or a kernels.Kernel)"""
+        self.preset = new_kernel if isinstance(new_kernel, Kernel) else None
+        # The grid edits its own copy of the weights
+        self.kernel = np.array(new_kernel)
+        self.grid_size = self.kernel.shape[0]
     
     def get_kernel(self):
-        """Get the current kernel"""
+        """Get the current kernel: the Kernel it was set from while unedited, else a copy of the grid"""
+        if self.preset is not None:
+            return self.preset
         return self.kernel.copy()
     
+    def grid_surface(self, font):
+        """The grid cells as one surface, built from the kernel with NumPy
+        
+        Cell colors are computed for the whole kernel at once and scaled up
+        to the cell size in a single step; grid lines and value labels are
+        only added when cells are large enough to show them.
+        """
+        cell_size = self.cell_size
+        key = (self.kernel.shape, self.kernel.tobytes(), cell_size, font)
+        if key == self._grid_key:
+            return self._grid_surface
+        
+        rows, cols = self.kernel.shape
+        colors = pygame.surfarray.make_surface(kernel_colors(self.kernel).transpose(1, 0, 2))
+        grid = pygame.transform.scale(colors, (cols * cell_size, rows * cell_size))
+        
+        if cell_size >= GRID_LINE_MIN_CELL_SIZE:
+            # Subtle lines for small cells, so they don't drown the colors
+            line_color = ACCENT_BLUE if cell_size >= LABEL_MIN_CELL_SIZE else GRID_BG
+            for col in range(1, cols):
+                pygame.draw.line(grid, line_color, (col * cell_size, 0), (col * cell_size, grid.get_height()))
+            for row in range(1, rows):
+                pygame.draw.line(grid, line_color, (0, row * cell_size), (grid.get_width(), row * cell_size))
+        
+        if cell_size >= LABEL_MIN_CELL_SIZE:
+            for row in range(rows):
+                for col in range(cols):
+                    text = render_text(font, f"{int(self.kernel[row, col])}", TEXT_COLOR)
+                    center = (col * cell_size + cell_size // 2, row * cell_size + cell_size // 2)
+                    grid.blit(text, text.get_rect(center=center))
+        
+        self._grid_surface = grid
+        self._grid_key = key
+        return grid
+    
     def draw(self, surface, x, y, font_medium, title_y_offset=-70):
         """Draw the kernel grid at the specified position"""
         grid_width = self.grid_size * self.cell_size
         grid_height = self.grid_size * self.cell_size
         
         # Draw grid title
-        title_text = font_medium.render("Kernel Editor (Click to cycle -5 to 5, Right-click for reverse)", True, TEXT_COLOR)
+        title_text = render_text(font_medium, "Kernel Editor (Click to cycle -5 to 5, Right-click for reverse)", TEXT_COLOR)
         title_rect = title_text.get_rect(center=(x + grid_width // 2, y + title_y_offset))
         surface.blit(title_text, title_rect)
         
-        # Draw grid background
+        # Draw grid cells (one blit, whatever the kernel size) and border
         grid_rect = pygame.Rect(x, y, grid_width, grid_height)
-        pygame.draw.rect(surface, GRID_BG, grid_rect)
-        pygame.draw.rect(surface, ACCENT_BLUE, grid_rect, 2)
-        
-        # Draw grid cells
-        for row in range(self.grid_size):
-            for col in range(self.grid_size):
-                cell_x = x + col * self.cell_size
-                cell_y = y + row * self.cell_size
-                
-                cell_rect = pygame.Rect(cell_x, cell_y, self.cell_size, self.cell_size)
-                
-                # Determine cell color based on kernel value
-                value = self.kernel[row, col]
-                if value > 0:
-                    # Positive values: teal with intensity based on value
-                    intensity = min(255, int(abs(value) * 50))
-                    color = (0, 230 - intensity//2, 180 + intensity//4)
-                    # Add glow for higher values
-                    if value > 1:
-                        glow_rect = cell_rect.inflate(4, 4)
-                        pygame.draw.rect(surface, color, glow_rect, 1, border_radius=5)
-                elif value < 0:
-                    # Negative values: pink with intensity based on value
-                    intensity = min(255, int(abs(value) * 50))
-                    color = (255, 60 + intensity//4, 100 + intensity//2)
-                    # Add glow for higher absolute values
-                    if abs(value) > 1:
-                        glow_rect = cell_rect.inflate(4, 4)
-                        pygame.draw.rect(surface, color, glow_rect, 1, border_radius=5)
-                else:
-                    # Zero: dark gray
-                    color = ZERO_VALUE
-                
-                pygame.draw.rect(surface, color, cell_rect, border_radius=5)
-                pygame.draw.rect(surface, ACCENT_BLUE, cell_rect, 1, border_radius=5)
-                
-                # Draw value text
-                text = font_medium.render(f"{int(value)}", True, TEXT_COLOR)
-                text_rect = text.get_rect(center=(cell_x + self.cell_size // 2, cell_y + self.cell_size // 2))
-                surface.blit(text, text_rect)
+        surface.blit(self.grid_surface(font_medium), grid_rect)
+        pygame.draw.rect(surface, ACCENT_BLUE, grid_rect.inflate(4, 4), 2)
     
     def handle_click(self, pos, x, y, button=1):
         """Handle mouse click on the kernel grid
@@ -107,6 +141,7 @@ class KernelEditor:
             row = (pos[1] - y) // self.cell_size
             
             if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
+                self.preset = None
                 # Cycle kernel value from -5 to 5
                 current_value = self.kernel[row, col]
                 
@@ -0,0 +1,194 @@
+import functools
+import math
+import numpy as np
+
+from filters import all_presets
+from convolution import normalization_divisor, is_integer_kernel, separable_factors, integer_factors
+
+class Kernel:
+    """An immutable kernel with its properties computed once
+
+    Works wherever a kernel array is accepted (np.asarray(kernel) returns
+    the read-only weights without copying), so it can be passed straight to
+    apply_kernel, filter_array or filter_bank.
+
+    Attributes:
+        name: Registry name (with parameters for generated kernels)
+        weights: Read-only weights (int64 for integer kernels, else float)
+        divisor: Normalization divisor (the sum for blur kernels, else 1)
+        normalized: Read-only weights / divisor
+        is_integer: True if every weight is a whole number
+        factors: SVD (column, row) factor pairs, or None if dense is cheaper
+        integer_factors: Exact integer rank-1 factors, or None
+        output_bounds: (min, max) of the unclipped result on 8-bit images
+    """
+    def __init__(self, name, weights):
+        weights = np.array(weights)
+        if weights.ndim != 2:
+            raise ValueError(f"Kernel must be 2D, got shape {weights.shape}")
+        self.is_integer = is_integer_kernel(weights)
+        weights = weights.astype(np.int64 if self.is_integer else float)
+        weights.flags.writeable = False
+
+        self.name = name
+        self.weights = weights
+        self.shape = weights.shape
+        self.divisor = normalization_divisor(weights)
+        self.normalized = weights / self.divisor
+        self.normalized.flags.writeable = False
+        self.factors = separable_factors(weights)
+        self.integer_factors = integer_factors(weights)
+        self.output_bounds = (255 * float(self.normalized[self.normalized < 0].sum()),
+                              255 * float(self.normalized[self.normalized > 0].sum()))
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or np.dtype(dtype) == self.weights.dtype:
+            return self.weights.copy() if copy else self.weights
+        return self.weights.astype(dtype)
+
+    def __reduce__(self):
+        # Rebuilt through __init__, so unpickled weights are read-only too
+        return Kernel, (self.name, self.weights)
+
+    def __repr__(self):
+        return f"Kernel({self.name!r}, {self.shape[0]}x{self.shape[1]})"
+
+    def __eq__(self, other):
+        return isinstance(other, Kernel) and np.array_equal(self.weights, other.weights)
+
+    def __hash__(self):
+        return hash((self.shape, self.weights.tobytes()))
+
+    @property
+    def needs_clipping(self):
+        """True if some 8-bit input can produce values outside 0-255"""
+        low, high = self.output_bounds
+        # Allow for rounding in the normalized weights of exact blurs
+        return low < -1e-9 or high > 255 + 1e-9
+
+def default_size(sigma):
+    """Odd kernel size covering +-3 sigma"""
+    return 2 * math.ceil(3 * sigma) + 1
+
+def check_odd_size(size):
+    """Raise ValueError unless size is a positive odd number"""
+    if size < 1 or size % 2 == 0:
+        raise ValueError(f"Kernel size must be a positive odd number, got {size}")
+
+def binomial_row(size):
+    """Row `size` of Pascal's triangle, e.g. 5 -> [1, 4, 6, 4, 1]"""
+    return np.array([math.comb(size - 1, i) for i in range(size)], dtype=np.int64)
+
+@functools.lru_cache(maxsize=64)
+def gaussian(sigma, size=None):
+    """Gaussian blur with standard deviation sigma (weights sum to 1)"""
+    size = default_size(sigma) if size is None else size
+    check_odd_size(size)
+    x = np.arange(size) - size // 2
+    profile = np.exp(-x ** 2 / (2 * sigma ** 2))
+    profile /= profile.sum()
+    return Kernel(f"gaussian(sigma={sigma}, size={size})", np.outer(profile, profile))
+
+@functools.lru_cache(maxsize=64)
+def box(radius):
+    """Box blur over a (2 * radius + 1) square (integer, normalized by its sum)"""
+    size = 2 * radius + 1
+    return Kernel(f"box(radius={radius})", np.ones((size, size), dtype=np.int64))
+
+@functools.lru_cache(maxsize=64)
+def sobel(size=3, axis='x'):
+    """Sobel derivative of any odd size along 'x' or 'y'
+
+    Binomial smoothing across the axis times a binomial-smoothed central
+    difference along it; positive where intensity increases to the right
+    (x) or downwards (y). Integer weights, so it runs on the exact path.
+    """
+    check_odd_size(size)
+    if size < 3:
+        raise ValueError("Sobel kernels need a size of at least 3")
+    if axis not in ('x', 'y'):
+        raise ValueError(f"Unknown axis: {axis}")
+    smooth = binomial_row(size)
+    derivative = np.convolve(binomial_row(size - 2), [1, 0, -1])[::-1]
+    weights = np.outer(smooth, derivative)
+    return Kernel(f"sobel(size={size}, axis={axis})", weights if axis == 'x' else weights.T)
+
+@functools.lru_cache(maxsize=64)
+def laplacian_of_gaussian(sigma, size=None):
+    """Laplacian of Gaussian edge detector (sums to 0)
+
+    The sign is flipped, like edge_detection, so edges come out bright;
+    weights are scaled so the positive ones sum to 1.
+    """
+    size = default_size(sigma) if size is None else size
+    check_odd_size(size)
+    x = np.arange(size) - size // 2
+    r2 = x[:, None] ** 2 + x[None, :] ** 2
+    weights = (1 - r2 / (2 * sigma ** 2)) * np.exp(-r2 / (2 * sigma ** 2))
+    weights -= weights.mean()
+    weights /= weights[weights > 0].sum()
+    return Kernel(f"laplacian_of_gaussian(sigma={sigma}, size={size})", weights)
+
+# Parametric kernel generators by name, with the type of each parameter
+GENERATORS = {
+    'gaussian': (gaussian, {'sigma': float, 'size': int}),
+    'box': (box, {'radius': int}),
+    'sobel': (sobel, {'size': int, 'axis': str}),
+    'log': (laplacian_of_gaussian, {'sigma': float, 'size': int}),
+}
+
+class KernelRegistry:
+    """Named presets and parametric generators, as shared Kernel objects
+
+    Presets are built once on first use; generated kernels are cached per
+    parameters, so asking for the same large kernel again is a lookup.
+    """
+    def __init__(self, presets=None):
+        self._presets = presets
+        self._kernels = {}
+
+    def preset_names(self):
+        """Names of the KernelFilters presets, in definition order"""
+        if self._presets is None:
+            self._presets = all_presets()
+        return list(self._presets)
+
+    def preset(self, name):
+        """The Kernel for a KernelFilters preset"""
+        kernel = self._kernels.get(name)
+        if kernel is None:
+            if name not in self.preset_names():
+                raise ValueError(f"Unknown preset: {name} (choose from {', '.join(self.names())})")
+            kernel = self._kernels[name] = Kernel(name, self._presets[name])
+        return kernel
+
+    def generate(self, name, **params):
+        """A parametric kernel, e.g. generate('gaussian', sigma=4)"""
+        if name not in GENERATORS:
+            raise ValueError(f"Unknown kernel generator: {name} (choose from {', '.join(GENERATORS)})")
+        return GENERATORS[name][0](**params)
+
+    def get(self, spec):
+        """Look up a preset name or a generator spec like 'gaussian:sigma=4,size=25'"""
+        name, _, arguments = spec.partition(':')
+        if name not in GENERATORS:
+            return self.preset(name)
+
+        types = GENERATORS[name][1]
+        params = {}
+        for argument in filter(None, arguments.split(',')):
+            key, _, value = argument.partition('=')
+            key = key.strip()
+            if key not in types:
+                raise ValueError(f"Unknown parameter for {name}: {key} (choose from {', '.join(types)})")
+            params[key] = types[key](value.strip())
+        try:
+            return self.generate(name, **params)
+        except TypeError as e:
+            raise ValueError(f"Bad parameters for {name}: {e}")
+
+    def names(self):
+        """Preset names followed by generator names"""
+        return self.preset_names() + list(GENERATORS)
+
+REGISTRY = KernelRegistry()
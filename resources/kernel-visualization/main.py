@@ -1,13 +1,30 @@
-import pygame
+import os
 import sys
+import time
+
+# Startup timeline printed by --profile-startup: (phase, time it ended)
+STARTUP_MARKS = [("start", time.perf_counter())]
+
+def mark_startup(phase):
+    """Record that a startup phase ended now"""
+    STARTUP_MARKS.append((phase, time.perf_counter()))
+
+import pygame
 import numpy as np
-from PIL import Image
+mark_startup("import pygame, numpy")
 
 # Import our modules
-from ui import Button, load_fonts, draw_panel, DARK_BG, PANEL_BG, ACCENT_BLUE, TEXT_COLOR
-from filters import KernelFilters
-from image_utils import create_test_image, create_mario_image, load_image_from_file, apply_kernel, pil_to_pygame
+from ui import Button, load_fonts, draw_panel, render_text, DARK_BG, PANEL_BG, ACCENT_BLUE, TEXT_COLOR
+from kernels import REGISTRY, sobel
+from pipeline import Pipeline, Linear, Abs, Threshold, Magnitude
+from image_utils import (builtin_image, image_to_array, SurfaceConverter,
+                         COLOR_MODES, IMAGE_DISPLAY_SIZE)
+from convolution import IncrementalConvolver, filter_array, filter_bank, rescale_kernel
+from worker import LatestWinsWorker
+from result_cache import ResultCache, image_hash, result_key, result_nbytes
 from kernel_editor import KernelEditor
+from profiling import PROFILER, span
+mark_startup("import app modules")
 
 # Constants
 WINDOW_WIDTH = 1000
@@ -15,20 +32,59 @@ GRID_SIZE = 5  # Default kernel size (5x5) - updated from 3x3
 WINDOW_HEIGHT = 700
 CELL_SIZE = 50
 GRID_MARGIN = 30
-IMAGE_DISPLAY_SIZE = (280, 280)
 BUTTON_HEIGHT = 40
 BUTTON_WIDTH = 140
 BUTTON_MARGIN = 15
 PANEL_PADDING = 20
+RESULT_CACHE_BYTES = 64 * 1024 * 1024  # Memory budget for cached results
+MAX_DIRTY_RECTS = 8  # Above this, dirty areas are merged into one rect
+PROGRESSIVE_PREVIEW = True  # Show a display-sized preview before full-resolution results
+GALLERY_THUMB_SIZE = (120, 120)
+GALLERY_COLUMNS = 7
+COLOR_MODE_LABELS = {'L': "Mode: Gray", 'RGB': "Mode: RGB", 'RGBA': "Mode: RGBA"}
+OVERLAY_KEY = pygame.K_F3  # Show/hide the performance overlay
+TRACE_KEY = pygame.K_F4  # Export recorded spans as a Chrome trace
+PREVIOUS_IMAGE_KEY = pygame.K_LEFT  # Step through the images of an opened directory
+NEXT_IMAGE_KEY = pygame.K_RIGHT
+OVERLAY_RECT = pygame.Rect(10, 50, 340, 420)  # Largest area the overlay covers
+STREAM_INFO_RECT = pygame.Rect(WINDOW_WIDTH // 2 - 250, 45, 500, 24)
+PIPELINE_INFO_RECT = pygame.Rect(WINDOW_WIDTH // 2 - 340, 95, 680, 24)
+# Filter chains selectable with the "Pipeline" button; 'kernel' is the editor's kernel
+PIPELINE_PRESETS = [
+    ("Off", ()),
+    ("Kernel > Abs", ('kernel', 'abs')),
+    ("Blur > Kernel", ('blur', 'kernel')),
+    ("Blur > Kernel > Abs", ('blur', 'kernel', 'abs')),
+    ("Blur > Kernel > Edge Magnitude", ('blur', 'kernel', 'magnitude')),
+    ("Blur > Kernel > Threshold", ('blur', 'kernel', 'threshold')),
+]
+FIRST_FRAME_TARGET = 0.5  # Seconds from the start of main.py to the first frame on screen
+
+def startup_report():
+    """Time spent in each startup phase, as printable text"""
+    start = previous = STARTUP_MARKS[0][1]
+    lines = ["Startup (since main.py started):"]
+    for phase, ended in STARTUP_MARKS[1:]:
+        lines.append(f"  {phase:<24}{(ended - previous) * 1000:8.1f} ms   at {(ended - start) * 1000:7.1f} ms")
+        previous = ended
+    first_frame = dict(STARTUP_MARKS).get("first frame")
+    if first_frame is not None:
+        elapsed = first_frame - start
+        verdict = "within" if elapsed <= FIRST_FRAME_TARGET else "OVER"
+        lines.append(f"Time to first frame: {elapsed * 1000:.0f} ms "
+                     f"({verdict} the {FIRST_FRAME_TARGET * 1000:.0f} ms target)")
+    return "\n".join(lines)
 
 class KernelVisualizer:
-    def __init__(self):
+    def __init__(self, profile_startup=False):
         # Initialize pygame
         pygame.init()
+        mark_startup("pygame.init")
         
         # Create window
         self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
         pygame.display.set_caption("Image Kernel Visualizer - (c) Enric Junque de Fortuny 2025")
+        mark_startup("open window")
         
         # Initialize clock
         self.clock = pygame.time.Clock()
@@ -36,21 +92,86 @@ class KernelVisualizer:
         
         # Load fonts
         self.font_large, self.font_medium, self.font_small = load_fonts()
+        mark_startup("load fonts")
         
         # Create kernel editor
         self.kernel_editor = KernelEditor(GRID_SIZE, CELL_SIZE, PANEL_PADDING)
         
         # Image processing
         self.original_image = None
-        self.processed_image = None
+        self.processed_output = None  # (uint8 array, mode, alpha) of the shown result
         self.original_surface = None
         self.processed_surface = None
+        self.color_mode = 'L'  # One of COLOR_MODES
+        
+        # Convolution runs on a background thread; only the newest request
+        # is computed and the frame loop swaps results in as they land
+        self.worker = LatestWinsWorker()
+        
+        # Builds display surfaces straight from result arrays (worker thread only)
+        self.surface_converter = SurfaceConverter()
+        
+        # Unclipped result of the last apply, updated incrementally on edits
+        # (only touched from the worker thread)
+        self.convolver = None
+        self.convolver_source = (None, None)  # (image, mode) it was built for
+        self.alpha = None
+        
+        # Results (PIL image + display surface) of recent kernel applications,
+        # so switching back to a preset is a lookup instead of a convolution
+        self.result_cache = ResultCache(RESULT_CACHE_BYTES)
+        self.hashed_image = (None, None)  # (image, content hash)
+        
+        # Display-sized proxy of large images, convolved first for a preview
+        self.progressive = PROGRESSIVE_PREVIEW
+        self.proxy = (None, None, None)  # (image, mode, (array, alpha, scale))
+        
+        # What was last drawn, to find the areas that need a redraw
+        self.dirty_rects = []
+        self.drawn_state = {
+            'buttons': {},
+            'kernel': None,
+            'original': (None, False, None),
+            'processed': (None, False, None),
+            'gallery': (False, None),
+            'overlay': False,
+            'stream': False,
+            'browser': None,
+            'pipeline': 0,
+        }
+        
+        # Gallery view: every preset applied at once, shown as thumbnails
+        self.show_gallery = False
+        self.gallery = []  # [(preset name, kernel, thumbnail surface)]
+        
+        # Timing spans of every stage, shown in an overlay on demand
+        PROFILER.enabled = True
+        self.show_overlay = False
+        self.apply_started = None  # When the kernel whose result is awaited was applied
+        
+        # Video / image-sequence playback (a StreamPipeline) replacing the still image
+        self.stream = None
+        self.display_converter = SurfaceConverter()  # UI thread only: originals and stream frames
+        
+        # Images of a directory opened from the command line (an ImageBrowser),
+        # and the (preview, image) futures of the one being decoded
+        self.browser = None
+        self.pending_image = None
+        
+        # Optional chain of stages around the editor's kernel (index into PIPELINE_PRESETS)
+        self.pipeline_index = 0
         
         # Create buttons
         self.create_buttons()
+        mark_startup("create widgets")
         
-        # Create Mario image by default
-        self.create_mario_image()
+        # Show the Mario image by default; its convolution starts once the
+        # first frame is on screen (see startup_frame_shown), so the worker
+        # doesn't compete with drawing the window
+        self.create_mario_image(apply=False)
+        mark_startup("load built-in image")
+        self.startup_step = 'first_frame'
+        self.profile_startup = profile_startup
     
     def create_buttons(self):
         """Create all the buttons for the application"""
@@ -94,7 +215,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "All Edges",
-            lambda: self.set_kernel_and_apply(KernelFilters.edge_detection())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('edge_detection'))
         ))
         
         self.buttons.append(Button(
@@ -103,7 +224,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Left Edge",
-            lambda: self.set_kernel_and_apply(KernelFilters.left_edge())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('left_edge'))
         ))
         
         # Row 2 - More kernels
@@ -115,7 +236,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Top Edge",
-            lambda: self.set_kernel_and_apply(KernelFilters.top_edge())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('top_edge'))
         ))
         
         self.buttons.append(Button(
@@ -124,7 +245,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Diagonal Edge",
-            lambda: self.set_kernel_and_apply(KernelFilters.diagonal_edge())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('diagonal_edge'))
         ))
         
         self.buttons.append(Button(
@@ -133,7 +254,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Box Blur",
-            lambda: self.set_kernel_and_apply(KernelFilters.box_blur())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('box_blur'))
         ))
         
         self.buttons.append(Button(
@@ -142,7 +263,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Gaussian Blur",
-            lambda: self.set_kernel_and_apply(KernelFilters.gaussian_blur())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('gaussian_blur'))
         ))
         
         # Row 3 - More filters
@@ -154,7 +275,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Sharpen",
-            lambda: self.set_kernel_and_apply(KernelFilters.sharpen())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('sharpen'))
         ))
         
         self.buttons.append(Button(
@@ -163,7 +284,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Emboss",
-            lambda: self.set_kernel_and_apply(KernelFilters.emboss())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('emboss'))
         ))
         
         self.buttons.append(Button(
@@ -172,7 +293,7 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Ring Detect",
-            lambda: self.set_kernel_and_apply(KernelFilters.ring_detection())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('ring_detection'))
         ))
         
         self.buttons.append(Button(
@@ -181,21 +302,60 @@ class KernelVisualizer:
             BUTTON_WIDTH,
             BUTTON_HEIGHT,
             "Motion Blur",
-            lambda: self.set_kernel_and_apply(KernelFilters.motion_blur())
+            lambda: self.set_kernel_and_apply(REGISTRY.preset('motion_blur'))
         ))
+        
+        # Color mode toggle (top right corner)
+        self.color_mode_button = Button(
+            WINDOW_WIDTH - BUTTON_WIDTH - BUTTON_MARGIN,
+            BUTTON_MARGIN,
+            BUTTON_WIDTH,
+            BUTTON_HEIGHT,
+            COLOR_MODE_LABELS[self.color_mode],
+            self.cycle_color_mode
+        )
+        self.buttons.append(self.color_mode_button)
+        
+        # Gallery toggle (top left corner)
+        self.gallery_button = Button(
+            BUTTON_MARGIN,
+            BUTTON_MARGIN,
+            BUTTON_WIDTH,
+            BUTTON_HEIGHT,
+            "Gallery",
+            self.toggle_gallery
+        )
+        self.buttons.append(self.gallery_button)
+        
+        # Pipeline selector (below the color mode toggle)
+        self.pipeline_button = Button(
+            WINDOW_WIDTH - BUTTON_WIDTH - BUTTON_MARGIN,
+            BUTTON_MARGIN * 2 + BUTTON_HEIGHT,
+            BUTTON_WIDTH,
+            BUTTON_HEIGHT,
+            "Pipeline: Off",
+            self.cycle_pipeline
+        )
+        self.buttons.append(self.pipeline_button)
     
-    def create_test_image(self):
-        """Create a test image"""
-        self.original_image = create_test_image()
+    def create_test_image(self, apply=True):
+        """Show the built-in test image"""
+        self.stop_stream()
+        self.pending_image = None
+        self.original_image = builtin_image('test')
         self.update_image_display()
-        self.apply_kernel()
+        if apply:
+            self.apply_kernel()
         return True
     
-    def create_mario_image(self):
-        """Create a Mario image"""
-        self.original_image = create_mario_image()
+    def create_mario_image(self, apply=True):
+        """Show the built-in Mario image"""
+        self.stop_stream()
+        self.pending_image = None
+        self.original_image = builtin_image('mario')
         self.update_image_display()
-        self.apply_kernel()
+        if apply:
+            self.apply_kernel()
         return True
     
     def reset_kernel_and_apply(self):
@@ -207,86 +367,608 @@ class KernelVisualizer:
     def set_kernel_and_apply(self, kernel):
         """Set kernel to a new value and apply"""
         self.kernel_editor.set_kernel(kernel)
+        self.set_gallery(False)
         self.apply_kernel()
         return True
     
+    def cycle_color_mode(self):
+        """Switch between grayscale, RGB and RGBA processing and re-apply"""
+        index = COLOR_MODES.index(self.color_mode)
+        self.color_mode = COLOR_MODES[(index + 1) % len(COLOR_MODES)]
+        self.color_mode_button.text = COLOR_MODE_LABELS[self.color_mode]
+        if self.stream:
+            self.stream.mode = self.color_mode
+        if self.show_gallery:
+            self.compute_gallery_async()
+        else:
+            self.apply_kernel()
+        return True
+    
+    def cycle_pipeline(self):
+        """Switch to the next filter chain of PIPELINE_PRESETS and re-apply"""
+        self.pipeline_index = (self.pipeline_index + 1) % len(PIPELINE_PRESETS)
+        self.pipeline_button.text = "Pipeline: Off" if self.pipeline_index == 0 else f"Pipeline: {self.pipeline_index}"
+        self.set_gallery(False)
+        self.apply_kernel()
+        return True
+    
+    def current_pipeline(self, kernel):
+        """The selected filter chain around kernel, or None when pipelines are off"""
+        name, spec = PIPELINE_PRESETS[self.pipeline_index]
+        if not spec:
+            return None
+        stages = {
+            'kernel': lambda: Linear(kernel, "Kernel"),
+            'blur': lambda: Linear(REGISTRY.preset('gaussian_blur'), "Blur"),
+            'abs': Abs,
+            'magnitude': lambda: Magnitude(sobel(3, 'x'), sobel(3, 'y')),
+            'threshold': lambda: Threshold(128),
+        }
+        return Pipeline([stages[token]() for token in spec])
+    
+    def current_filter(self):
+        """What the stream applies to each frame: the selected pipeline or the editor's kernel"""
+        kernel = self.kernel_editor.get_kernel()
+        return self.current_pipeline(kernel) or kernel
+    
+    def toggle_gallery(self):
+        """Switch between the kernel editor and the gallery of all presets"""
+        self.set_gallery(not self.show_gallery)
+        if self.show_gallery:
+            self.compute_gallery_async()
+        else:
+            self.apply_kernel()
+        return True
+    
+    def set_gallery(self, show):
+        """Show or hide the gallery view"""
+        self.show_gallery = show
+        self.gallery_button.text = "Editor" if show else "Gallery"
+    
+    def compute_gallery_async(self):
+        """Apply every preset to the original image (in the background)"""
+        if not self.original_image:
+            return False
+        image, mode = self.original_image, self.color_mode
+        self.worker.submit(lambda: self.compute_gallery(image, mode))
+        return True
+    
+    def compute_gallery(self, image, mode):
+        """All preset responses in one filter-bank pass (runs on the worker thread)"""
+        presets = [REGISTRY.preset(name) for name in REGISTRY.preset_names()]
+        img_array = image_to_array(image, mode)
+        alpha = None
+        if mode == 'RGBA':
+            img_array, alpha = img_array[..., :3], img_array[..., 3]
+        
+        responses = filter_bank(img_array, presets)
+        
+        gallery = []
+        for kernel, response in zip(presets, responses):
+            thumbnail = self.surface_converter.to_surface(response, GALLERY_THUMB_SIZE)
+            gallery.append((kernel.name, kernel, thumbnail))
+        return ('gallery', gallery)
+    
     def update_image_display(self):
-        """Update the pygame surfaces from PIL images"""
-        if self.original_image:
-            self.original_surface = pil_to_pygame(self.original_image, IMAGE_DISPLAY_SIZE)
+        """Update the pygame surface of the original image
         
-        if self.processed_image:
-            self.processed_surface = pil_to_pygame(self.processed_image, IMAGE_DISPLAY_SIZE)
+        The processed surface is built with its result on the worker thread.
+        """
+        with span('update_image_display'):
+            if self.original_image:
+                self.original_surface = self.image_surface(self.original_image, IMAGE_DISPLAY_SIZE)
+    
+    def image_surface(self, image, size=None):
+        """Display surface of a PIL image, through the UI thread's converter"""
+        mode = 'L' if image.mode == 'L' else 'RGB'
+        return self.display_converter.to_surface(image_to_array(image, mode), size)
     
     def apply_kernel(self):
-        """Apply the current kernel to the original image"""
+        """Apply the current kernel to the original image (in the background)"""
+        if self.stream:
+            return True  # The stream picks up the kernel on its next frame
         if not self.original_image:
             return False
         
         # Get the current kernel
         kernel = self.kernel_editor.get_kernel()
+        image, mode = self.original_image, self.color_mode
+        pipeline = self.current_pipeline(kernel)
         
-        # Apply the kernel to the image
-        self.processed_image = apply_kernel(self.original_image, kernel)
+        # Hand the work to the worker; poll_results() picks up the result
+        with span('apply_kernel'):
+            self.worker.submit(lambda: self.compute_processed(image, kernel, mode, pipeline))
+        self.apply_started = time.perf_counter()
         
-        # Update the display
-        self.update_image_display()
+        return True
+    
+    def proxy_for(self, image, mode):
+        """Display-sized proxy array of image, its alpha and the (y, x) scale factors"""
+        proxy_image, proxy_mode, proxy = self.proxy
+        if proxy_image is not image or proxy_mode != mode:
+            small = image.copy()
+            small.thumbnail(IMAGE_DISPLAY_SIZE)
+            proxy_array = image_to_array(small, mode)
+            alpha = None
+            if mode == 'RGBA':
+                proxy_array, alpha = proxy_array[..., :3], proxy_array[..., 3]
+            scale = (image.height / small.height, image.width / small.width)
+            proxy = (proxy_array, alpha, scale)
+            self.proxy = (image, mode, proxy)
+        return proxy
+    
+    def compute_preview(self, image, kernel, mode):
+        """Convolve a display-sized proxy with the kernel rescaled to match"""
+        with span('preview'):
+            proxy_array, alpha, scale = self.proxy_for(image, mode)
+            preview_kernel = rescale_kernel(kernel, *scale)
+            preview = filter_array(proxy_array, preview_kernel)
+            return ('processed', (preview, mode, alpha), self.surface_converter.to_surface(preview))
+    
+    def compute_processed(self, image, kernel, mode, pipeline=None):
+        """Convolve and build the display surface (runs on the worker thread)
+        
+        Yields a quick preview for images larger than the display, then the
+        full-resolution result. With a pipeline, its fused stages are run
+        instead of the kernel alone.
+        """
+        # Hash the image content once per image
+        hashed_image, digest = self.hashed_image
+        if hashed_image is not image:
+            with span('hash'):
+                digest = image_hash(image)
+            self.hashed_image = (image, digest)
+        
+        key = result_key(digest, kernel, mode)
+        if pipeline is not None:
+            key += (pipeline.describe(),)
+        cached = self.result_cache.get(key)
+        if cached:
+            yield ('processed',) + cached
+            return
         
+        # Instant preview from the display-sized proxy (large images only)
+        if pipeline is None and self.progressive and (image.width > IMAGE_DISPLAY_SIZE[0]
+                                                      or image.height > IMAGE_DISPLAY_SIZE[1]):
+            yield self.compute_preview(image, kernel, mode)
+        
+        # Keep one incremental convolver per image and mode, so single-cell
+        # edits cost one shifted add instead of a full convolution
+        source_image, source_mode = self.convolver_source
+        if source_image is not image or source_mode != mode:
+            img_array = image_to_array(image, mode)
+            self.alpha = None
+            if mode == 'RGBA':
+                img_array, self.alpha = img_array[..., :3], img_array[..., 3]
+            self.convolver = IncrementalConvolver(img_array)
+            self.convolver_source = (image, mode)
+        
+        # Apply the kernel (or the pipeline) to the image
+        if pipeline is not None:
+            with span('pipeline', passes=pipeline.fused_passes):
+                output = pipeline.run(self.convolver.image)
+        else:
+            with span('convolve', shape=list(kernel.shape)):
+                output = self.convolver.update(kernel)
+        with span('to_surface'):
+            processed_surface = self.surface_converter.to_surface(output, IMAGE_DISPLAY_SIZE)
+        
+        processed_output = (output, mode, self.alpha)
+        result = (processed_output, processed_surface)
+        self.result_cache.put(key, result, result_nbytes(output, processed_surface))
+        yield ('processed',) + result
+    
+    def poll_results(self):
+        """Swap in the newest finished result, if any (never blocks)"""
+        result = self.worker.poll()
+        if not result:
+            return
+        if result[0] == 'gallery':
+            self.gallery = result[1]
+        else:
+            # Result array and surface are replaced together
+            _, self.processed_output, self.processed_surface = result
+            
+            # Time from the edit to its first visible result
+            if self.apply_started is not None:
+                PROFILER.record('apply_latency', self.apply_started, time.perf_counter() - self.apply_started)
+                self.apply_started = None
+    
+    def start_stream(self, source, mode=None, workers=1):
+        """Play a FrameSource through the editor's kernel (edits apply on the next frame)"""
+        from streaming import StreamPipeline
+        
+        self.stop_stream()
+        self.set_gallery(False)
+        if mode:
+            self.color_mode = mode
+            self.color_mode_button.text = COLOR_MODE_LABELS[mode]
+        self.stream = StreamPipeline(source, self.current_filter, self.color_mode, loop=True, workers=workers)
+        self.stream.start()
         return True
     
-    def draw_images(self):
-        """Draw the original and processed images"""
+    def stop_stream(self):
+        """End playback (the last frame stays on screen)"""
+        if self.stream:
+            self.stream.stop()
+            self.stream = None
+    
+    def open_path(self, path):
+        """Browse the images of a directory, starting at path (an image file or a directory)"""
+        from image_loader import ImageBrowser
+        try:
+            browser = ImageBrowser(path, IMAGE_DISPLAY_SIZE)
+        except (OSError, ValueError) as e:
+            print(f"Error opening {path}: {e}")
+            return False
+        if self.browser:
+            self.browser.close()
+        self.browser = browser
+        self.show_requested_image(browser.request())
+        return True
+    
+    def step_image(self, delta):
+        """Show the next (delta=1) or previous (delta=-1) image of the directory"""
+        if not self.browser:
+            return False
+        self.show_requested_image(self.browser.step(delta))
+        return True
+    
+    def show_requested_image(self, request):
+        """Replace the image with one being decoded; poll_image() swaps it in"""
+        self.stop_stream()
+        self.pending_image = request
+        self.original_image = None
+        self.original_surface = None
+        self.processed_output = None
+        self.processed_surface = None
+        # Prefetched images are decoded already and show up right away
+        self.poll_image()
+    
+    def poll_image(self):
+        """Show a requested image once decoded: its preview first, then process the full image
+        
+        The preview (already display-sized) stays as the original's surface,
+        which spares the UI thread from shrinking the full image.
+        """
+        preview, image = self.pending_image
+        try:
+            if self.original_surface is None and preview.done():
+                self.original_surface = self.image_surface(preview.result())
+            if image.done():
+                self.pending_image = None
+                self.original_image = image.result()
+                self.apply_kernel()
+        except Exception as e:
+            self.pending_image = None
+            print(f"Error loading {self.browser.path}: {e}")
+    
+    def draw_browser_info(self):
+        """Name and position of the shown file"""
+        browser = self.browser
+        text = (f"{os.path.basename(browser.path)}   ({browser.index + 1} of {len(browser.files)}, "
+                f"Left/Right to browse)")
+        info = render_text(self.font_small, text, TEXT_COLOR)
+        self.screen.blit(info, info.get_rect(center=STREAM_INFO_RECT.center))
+    
+    def poll_stream(self):
+        """Show the newest processed frame of the stream, if one is ready"""
+        frame = self.stream.poll()
+        if frame is None:
+            return
+        _, source_frame, output, mode, alpha = frame
+        with span('stream.display'):
+            self.original_surface = self.display_converter.to_surface(source_frame, IMAGE_DISPLAY_SIZE)
+            self.processed_surface = self.display_converter.to_surface(output, IMAGE_DISPLAY_SIZE)
+        self.processed_output = (output, mode, alpha)
+    
+    def draw_stream_info(self):
+        """Achieved vs source frame rate and dropped frames"""
+        stats = self.stream.stats
+        text = (f"Stream: {stats.fps():.1f} / {self.stream.source.fps:.1f} fps   "
+                f"{stats.displayed} shown, {stats.dropped} dropped")
+        # Changes every frame, so it bypasses the text render cache
+        info = self.font_small.render(text, True, TEXT_COLOR)
+        self.screen.blit(info, info.get_rect(center=STREAM_INFO_RECT.center))
+    
+    def draw_pipeline_info(self):
+        """Selected pipeline and how many convolution passes fusion saved"""
+        name = PIPELINE_PRESETS[self.pipeline_index][0]
+        pipeline = self.current_pipeline(self.kernel_editor.kernel)
+        text = (f"{name}: {pipeline.fused_passes} passes instead of {pipeline.unfused_passes} "
+                f"(fusion saved {pipeline.passes_saved})")
+        info = render_text(self.font_small, text, TEXT_COLOR)
+        self.screen.blit(info, info.get_rect(center=PIPELINE_INFO_RECT.center))
+    
+    def grid_position(self):
+        """Top-left corner of the kernel grid (centered in the window)"""
+        grid_width = self.kernel_editor.grid_size * self.kernel_editor.cell_size
+        grid_height = self.kernel_editor.grid_size * self.kernel_editor.cell_size
+        grid_x = (WINDOW_WIDTH - grid_width) // 2
+        grid_y = (WINDOW_HEIGHT - grid_height) // 2 - 20
+        return grid_x, grid_y
+    
+    def image_panel_layout(self, center_x, surface):
+        """Panel rect and image position for an image shown around center_x"""
         # Calculate the vertical center position
         vertical_center = WINDOW_HEIGHT // 2 - 20  # Slight adjustment for buttons at bottom
         
+        if surface:
+            image_width = surface.get_width()
+            image_height = surface.get_height()
+        else:
+            image_width, image_height = IMAGE_DISPLAY_SIZE
+        image_x = center_x - image_width // 2
+        image_y = vertical_center - image_height // 2
+        
+        panel_rect = pygame.Rect(image_x - PANEL_PADDING, image_y - PANEL_PADDING - 30,
+                                 image_width + PANEL_PADDING * 2,
+                                 image_height + PANEL_PADDING * 2 + 30)
+        return panel_rect, (image_x, image_y)
+    
+    def draw_images(self):
+        """Draw the original and processed images
+        
+        Until an image or result is available its panel is drawn empty at
+        display size, so the layout is complete from the first frame.
+        """
         # Draw original image (left side)
+        panel_rect, image_pos = self.image_panel_layout(WINDOW_WIDTH // 6, self.original_surface)
+        
+        # Draw panel with title
+        draw_panel(self.screen, *panel_rect, "Original", self.font_medium)
+        
+        # Draw image
         if self.original_surface:
-            # Calculate position - left side
-            image_width = self.original_surface.get_width()
-            image_height = self.original_surface.get_height()
-            image_x = WINDOW_WIDTH // 6 - image_width // 2
-            image_y = vertical_center - image_height // 2
-            
-            # Draw panel background
-            panel_width = image_width + PANEL_PADDING * 2
-            panel_height = image_height + PANEL_PADDING * 2 + 30
-            panel_x = image_x - PANEL_PADDING
-            panel_y = image_y - PANEL_PADDING - 30
-            
-            # Draw panel with title
-            draw_panel(self.screen, panel_x, panel_y, panel_width, panel_height, 
-                      "Original", self.font_medium)
-            
-            # Draw image
-            self.screen.blit(self.original_surface, (image_x, image_y))
+            self.screen.blit(self.original_surface, image_pos)
         
         # Draw processed image (right side)
+        panel_rect, image_pos = self.image_panel_layout(5 * WINDOW_WIDTH // 6, self.processed_surface)
+        draw_panel(self.screen, *panel_rect, "Processed", self.font_medium)
         if self.processed_surface:
-            # Calculate position - right side
-            image_width = self.processed_surface.get_width()
-            image_height = self.processed_surface.get_height()
-            image_x = 5 * WINDOW_WIDTH // 6 - image_width // 2
-            image_y = vertical_center - image_height // 2
-            
-            # Draw panel background
-            panel_width = image_width + PANEL_PADDING * 2
-            panel_height = image_height + PANEL_PADDING * 2 + 30
-            panel_x = image_x - PANEL_PADDING
-            panel_y = image_y - PANEL_PADDING - 30
-            
-            # Draw panel with title
-            draw_panel(self.screen, panel_x, panel_y, panel_width, panel_height, 
-                      "Processed", self.font_medium)
+            self.screen.blit(self.processed_surface, image_pos)
+        
+        # Show that a newer result is being computed
+        if self.worker.busy:
+            busy_text = render_text(self.font_small, "Computing...", TEXT_COLOR)
+            busy_rect = busy_text.get_rect(bottomright=(panel_rect.right - 10, panel_rect.bottom - 4))
+            self.screen.blit(busy_text, busy_rect)
+    
+    def gallery_layout(self):
+        """Thumbnail rects of the gallery grid, one per preset"""
+        thumb_width, thumb_height = GALLERY_THUMB_SIZE
+        cell_width = thumb_width + 15
+        cell_height = thumb_height + 45
+        rows = (len(self.gallery) + GALLERY_COLUMNS - 1) // GALLERY_COLUMNS
+        left = (WINDOW_WIDTH - GALLERY_COLUMNS * cell_width) // 2
+        top = (WINDOW_HEIGHT - 100 - rows * cell_height) // 2 + 20
+        
+        rects = []
+        for index in range(len(self.gallery)):
+            row, col = divmod(index, GALLERY_COLUMNS)
+            rects.append(pygame.Rect(left + col * cell_width, top + row * cell_height + 25,
+                                     thumb_width, thumb_height))
+        return rects
+    
+    def draw_gallery(self):
+        """Draw every preset's response as a grid of thumbnails"""
+        if not self.gallery:
+            busy_text = render_text(self.font_medium, "Computing all presets...", TEXT_COLOR)
+            self.screen.blit(busy_text, busy_text.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 - 50)))
+            return
+        
+        for (name, _, thumbnail), rect in zip(self.gallery, self.gallery_layout()):
+            label = render_text(self.font_small, name.replace('_', ' ').title(), TEXT_COLOR)
+            self.screen.blit(label, label.get_rect(midbottom=(rect.centerx, rect.top - 5)))
+            self.screen.blit(thumbnail, thumbnail.get_rect(center=rect.center))
+            pygame.draw.rect(self.screen, ACCENT_BLUE, rect.inflate(4, 4), 1, border_radius=3)
+    
+    def handle_gallery_click(self, pos):
+        """Apply the preset whose thumbnail was clicked; True if one was"""
+        for (_, kernel, _), rect in zip(self.gallery, self.gallery_layout()):
+            if rect.collidepoint(pos):
+                self.set_kernel_and_apply(kernel)
+                return True
+        return False
+    
+    def toggle_overlay(self):
+        """Show or hide the performance overlay"""
+        self.show_overlay = not self.show_overlay
+        return True
+    
+    def export_trace(self):
+        """Write the recorded spans to a Chrome-trace JSON file in the working directory"""
+        path = time.strftime("kernel-trace-%Y%m%d-%H%M%S.json")
+        try:
+            count = PROFILER.export_chrome_trace(path)
+            print(f"Wrote {count} spans to {path}")
+        except OSError as e:
+            print(f"Error writing trace: {e}")
+            return False
+        return True
+    
+    def draw_overlay(self):
+        """Draw frame time and per-stage latency (last, p50, p95 in ms)"""
+        rows = [("stage", "last", "p50", "p95")]
+        for name, stats in PROFILER.stats().items():
+            rows.append((name,) + tuple(f"{stats[key] * 1000:.1f}" for key in ('last', 'p50', 'p95')))
+        
+        line_height = self.font_small.get_linesize()
+        max_rows = (OVERLAY_RECT.height - 16) // line_height - 2
+        height = min(len(rows), max_rows) * line_height + 2 * line_height + 16
+        overlay = pygame.Surface((OVERLAY_RECT.width, height), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 200))
+        
+        # Text changes every frame, so it bypasses the text render cache
+        header = f"Frame {self.clock.get_time()} ms   {self.clock.get_fps():.1f} fps"
+        overlay.blit(self.font_small.render(header, True, TEXT_COLOR), (10, 8))
+        for index, row in enumerate(rows[:max_rows]):
+            y = 8 + (index + 1) * line_height
+            overlay.blit(self.font_small.render(row[0], True, TEXT_COLOR), (10, y))
+            for column, value in enumerate(row[1:]):
+                text = self.font_small.render(value, True, TEXT_COLOR)
+                overlay.blit(text, text.get_rect(topright=(OVERLAY_RECT.width - 10 - (2 - column) * 55, y)))
+        footer = self.font_small.render("F3: hide   F4: export trace", True, TEXT_COLOR)
+        overlay.blit(footer, (10, height - 8 - line_height))
+        self.screen.blit(overlay, OVERLAY_RECT)
+    
+    def draw_scene(self):
+        """Draw the whole window (clipped to the screen's current clip rect)"""
+        # Fill background
+        self.screen.fill(DARK_BG)
+        
+        # Draw app title with copyright
+        title_text = render_text(self.font_large, "IMAGE KERNEL VISUALIZER", TEXT_COLOR)
+        title_rect = title_text.get_rect(center=(WINDOW_WIDTH // 2, 25))
+        self.screen.blit(title_text, title_rect)
+        
+        # Draw bottom panel for buttons
+        panel_height = 100
+        panel_y = WINDOW_HEIGHT - panel_height
+        panel_rect = pygame.Rect(0, panel_y, WINDOW_WIDTH, panel_height)
+        pygame.draw.rect(self.screen, PANEL_BG, panel_rect)
+        pygame.draw.line(self.screen, ACCENT_BLUE, (0, panel_y), (WINDOW_WIDTH, panel_y), 2)
+        
+        if self.show_gallery:
+            self.draw_gallery()
+        else:
+            # Draw images
+            self.draw_images()
             
-            # Draw image
-            self.screen.blit(self.processed_surface, (image_x, image_y))
+            # Draw kernel editor
+            grid_x, grid_y = self.grid_position()
+            self.kernel_editor.draw(self.screen, grid_x, grid_y, self.font_medium, title_y_offset=-50)
+        
+        # Draw buttons
+        for button in self.buttons:
+            button.draw(self.screen, self.font_medium)
+        
+        if self.stream:
+            self.draw_stream_info()
+        elif self.browser:
+            self.draw_browser_info()
+        
+        if self.pipeline_index and not self.show_gallery:
+            self.draw_pipeline_info()
+        
+        if self.show_overlay:
+            self.draw_overlay()
+    
+    def startup_frame_shown(self):
+        """Advance startup after a frame has been put on screen
+        
+        The first frame starts the initial convolution; once its result has
+        been shown, the startup report is printed if it was asked for.
+        """
+        if self.startup_step == 'first_frame':
+            mark_startup("first frame")
+            self.startup_step = 'first_result'
+            self.apply_kernel()
+        elif self.startup_step == 'first_result' and self.processed_surface is not None:
+            mark_startup("first result")
+            self.startup_step = None
+            if self.profile_startup:
+                print(startup_report())
+    
+    def mark_dirty(self, rect=None):
+        """Schedule an area of the window (all of it if rect is None) for redraw"""
+        self.dirty_rects.append(pygame.Rect(rect) if rect else self.screen.get_rect())
+    
+    def collect_dirty_rects(self):
+        """Compare the state on screen with the current state and mark what changed"""
+        drawn = self.drawn_state
+        
+        # Buttons: hover highlight or label changed
+        for button in self.buttons:
+            state = (button.hovered, button.text)
+            if drawn['buttons'].get(button) != state:
+                self.mark_dirty(button.rect.inflate(8, 8))
+                drawn['buttons'][button] = state
+        
+        # Kernel grid: only the edited cells, unless the grid was resized
+        kernel = self.kernel_editor.kernel
+        if drawn['kernel'] is None or drawn['kernel'].shape != kernel.shape:
+            self.mark_dirty()
+        else:
+            grid_x, grid_y = self.grid_position()
+            cell_size = self.kernel_editor.cell_size
+            for row, col in zip(*np.nonzero(kernel != drawn['kernel'])):
+                cell_rect = pygame.Rect(grid_x + col * cell_size, grid_y + row * cell_size,
+                                        cell_size, cell_size)
+                self.mark_dirty(cell_rect.inflate(6, 6))
+        drawn['kernel'] = kernel.copy()
+        
+        # Image panels: new surface or busy indicator toggled (the panels are
+        # drawn even without a surface, so the first pass records their rects)
+        for name, center_x, surface, busy in (
+                ('original', WINDOW_WIDTH // 6, self.original_surface, False),
+                ('processed', 5 * WINDOW_WIDTH // 6, self.processed_surface, self.worker.busy)):
+            drawn_surface, drawn_busy, drawn_rect = drawn[name]
+            if drawn_surface is not surface or drawn_busy != busy or drawn_rect is None:
+                panel_rect = self.image_panel_layout(center_x, surface)[0]
+                if drawn_rect and drawn_rect != panel_rect:
+                    self.mark_dirty(drawn_rect)
+                self.mark_dirty(panel_rect)
+                drawn[name] = (surface, busy, panel_rect)
+        
+        # Gallery shown, hidden or refreshed: redraw everything
+        gallery_state = (self.show_gallery, self.gallery)
+        drawn_show, drawn_gallery = drawn['gallery']
+        if drawn_show != self.show_gallery or drawn_gallery is not self.gallery:
+            self.mark_dirty()
+            drawn['gallery'] = gallery_state
+        
+        # Stream statistics change every frame (and the line goes when it stops)
+        if self.stream or drawn['stream']:
+            self.mark_dirty(STREAM_INFO_RECT)
+            drawn['stream'] = self.stream is not None
+        
+        # File name line: changes when browsing to another file
+        browser_path = self.browser.path if self.browser and not self.stream else None
+        if drawn['browser'] != browser_path:
+            self.mark_dirty(STREAM_INFO_RECT)
+            drawn['browser'] = browser_path
+        
+        # Pipeline info line: changes with the selected pipeline
+        if drawn['pipeline'] != self.pipeline_index:
+            self.mark_dirty(PIPELINE_INFO_RECT)
+            drawn['pipeline'] = self.pipeline_index
+        
+        # Overlay: its numbers change every frame while it's shown
+        if self.show_overlay or drawn['overlay']:
+            self.mark_dirty(OVERLAY_RECT)
+            drawn['overlay'] = self.show_overlay
+        
+        # Many small areas: one bounding rect is cheaper to redraw
+        if len(self.dirty_rects) > MAX_DIRTY_RECTS:
+            self.dirty_rects = [self.dirty_rects[0].unionall(self.dirty_rects[1:])]
     
     def run(self):
         """Main application loop"""
         while self.running:
+            frame_start = time.perf_counter()
+            
+            # Pick up finished background work
+            with span('frame.poll'):
+                self.poll_results()
+                if self.stream:
+                    self.poll_stream()
+                if self.pending_image:
+                    self.poll_image()
+            
+            events_start = time.perf_counter()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == OVERLAY_KEY:
+                        self.toggle_overlay()
+                    elif event.key == TRACE_KEY:
+                        self.export_trace()
+                    elif event.key == PREVIOUS_IMAGE_KEY:
+                        self.step_image(-1)
+                    elif event.key == NEXT_IMAGE_KEY:
+                        self.step_image(1)
                 elif event.type == pygame.MOUSEMOTION:
                     # Update button hover states
                     for button in self.buttons:
@@ -295,59 +977,65 @@ class KernelVisualizer:
                     # Handle mouse clicks
                     if event.button == 1 or event.button == 3:  # Left or right click
                         # Calculate kernel grid position
-                        grid_width = self.kernel_editor.grid_size * self.kernel_editor.cell_size
-                        grid_height = self.kernel_editor.grid_size * self.kernel_editor.cell_size
-                        grid_x = (WINDOW_WIDTH - grid_width) // 2
-                        grid_y = (WINDOW_HEIGHT - grid_height) // 2 - 20
+                        grid_x, grid_y = self.grid_position()
                         
-                        # Handle kernel grid clicks
-                        grid_clicked = self.kernel_editor.handle_click(event.pos, grid_x, grid_y, event.button)
+                        # Handle kernel grid clicks (or thumbnail clicks in the gallery)
+                        if self.show_gallery:
+                            grid_clicked = event.button == 1 and self.handle_gallery_click(event.pos)
+                        else:
+                            grid_clicked = self.kernel_editor.handle_click(event.pos, grid_x, grid_y, event.button)
+                            
+                            # Refresh the processed view live on every edit
+                            if grid_clicked:
+                                self.apply_kernel()
                         
                         # Handle button clicks only if grid wasn't clicked
                         if not grid_clicked and event.button == 1:
                             for button in self.buttons:
                                 button.handle_event(event)
             
-            # Fill background
-            self.screen.fill(DARK_BG)
-            
-            # Draw app title with copyright
-            title_text = self.font_large.render("IMAGE KERNEL VISUALIZER", True, TEXT_COLOR)
-            title_rect = title_text.get_rect(center=(WINDOW_WIDTH // 2, 25))
-            self.screen.blit(title_text, title_rect)
+            PROFILER.record('frame.events', events_start, time.perf_counter() - events_start)
             
-            # Draw bottom panel for buttons
-            panel_height = 100
-            panel_y = WINDOW_HEIGHT - panel_height
-            panel_rect = pygame.Rect(0, panel_y, WINDOW_WIDTH, panel_height)
-            pygame.draw.rect(self.screen, PANEL_BG, panel_rect)
-            pygame.draw.line(self.screen, ACCENT_BLUE, (0, panel_y), (WINDOW_WIDTH, panel_y), 2)
+            # Redraw only the areas that changed since the last frame
+            self.collect_dirty_rects()
+            if self.dirty_rects:
+                with span('frame.draw', rects=len(self.dirty_rects)):
+                    # One pass clipped to their bounding rect; only the
+                    # dirty rects themselves are pushed to the display
+                    self.screen.set_clip(self.dirty_rects[0].unionall(self.dirty_rects[1:]))
+                    self.draw_scene()
+                    self.screen.set_clip(None)
+                
+                # Update display
+                with span('frame.update'):
+                    pygame.display.update(self.dirty_rects)
+                self.dirty_rects = []
+                
+                if self.startup_step:
+                    self.startup_frame_shown()
             
-            # Draw images
-            self.draw_images()
-            
-            # Draw kernel grid
-            grid_width = self.kernel_editor.grid_size * self.kernel_editor.cell_size
-            grid_height = self.kernel_editor.grid_size * self.kernel_editor.cell_size
-            grid_x = (WINDOW_WIDTH - grid_width) // 2
-            grid_y = (WINDOW_HEIGHT - grid_height) // 2 - 20
-            
-            # Draw kernel editor
-            self.kernel_editor.draw(self.screen, grid_x, grid_y, self.font_medium, title_y_offset=-50)
-            
-            # Draw buttons
-            for button in self.buttons:
-                button.draw(self.screen, self.font_medium)
-            
-            # Update display
-            pygame.display.flip()
+            PROFILER.record('frame', frame_start, time.perf_counter() - frame_start)
             
             # Cap the frame rate
             self.clock.tick(60)
         
+        self.stop_stream()
+        if self.browser:
+            self.browser.close()
+        self.worker.stop()
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
-    app = KernelVisualizer()
-    app.run()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Interactive image kernel visualizer")
+    parser.add_argument('path', nargs='?',
+                        help="Image file or directory to open instead of the built-in image (browse with Left/Right)")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Print the time spent importing and initializing, up to the first frame and result")
+    args = parser.parse_args()
+    
+    app = KernelVisualizer(profile_startup=args.profile_startup)
+    if args.path:
+        app.open_path(args.path)
+    app.run()
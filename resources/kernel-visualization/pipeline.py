@@ -0,0 +1,163 @@
+import numpy as np
+
+from convolution import convolve2d, normalization_divisor, is_integer_kernel, to_uint8
+
+def convolve_kernels(first, second):
+    """Kernel equal to correlating with first, then with second
+
+    Correlation is convolution with the flipped kernel, so two passes
+    compose into one with their full 2D convolution (size adds up minus 1).
+    """
+    first = np.asarray(first)
+    second = np.asarray(second)
+    dtype = np.int64 if is_integer_kernel(first) and is_integer_kernel(second) else float
+    first = first.astype(dtype)
+    second = second.astype(dtype)
+    s_height, s_width = second.shape
+    fused = np.zeros((first.shape[0] + s_height - 1, first.shape[1] + s_width - 1), dtype=dtype)
+    for row, col in zip(*np.nonzero(first)):
+        fused[row:row + s_height, col:col + s_width] += first[row, col] * second
+    return fused
+
+class Linear:
+    """Correlate with a kernel (normalized like apply_kernel, but never clipped)"""
+    def __init__(self, kernel, name=None):
+        self.weights = np.asarray(kernel)
+        self.divisor = normalization_divisor(self.weights)
+        self.name = name or getattr(kernel, 'name', f"{self.weights.shape[0]}x{self.weights.shape[1]} kernel")
+
+class Abs:
+    """Absolute value, so negative responses show as bright as positive ones"""
+    name = 'abs'
+
+    def apply(self, values):
+        return np.abs(values)
+
+class Clip:
+    """Limit values to [low, high]"""
+    def __init__(self, low=0, high=255):
+        self.low = low
+        self.high = high
+        self.name = f"clip({low}, {high})"
+
+    def apply(self, values):
+        return np.clip(values, self.low, self.high)
+
+class Threshold:
+    """255 where the value is at least level, else 0"""
+    def __init__(self, level=128):
+        self.level = level
+        self.name = f"threshold({level})"
+
+    def apply(self, values):
+        return np.where(values >= self.level, 255.0, 0.0)
+
+class Magnitude:
+    """sqrt(x^2 + y^2) of the responses to two kernels (e.g. Sobel X and Y)"""
+    def __init__(self, kernel_x, kernel_y):
+        self.x = Linear(kernel_x)
+        self.y = Linear(kernel_y)
+        self.name = f"magnitude({self.x.name}, {self.y.name})"
+
+NONLINEAR_STAGES = (Abs, Clip, Threshold)
+
+class Pipeline:
+    """A chain of filter stages, with consecutive linear stages fused
+
+    Linear stages are combined ahead of time into a single kernel (see
+    convolve_kernels), so a blur followed by an edge detector traverses the
+    image once, and intermediate results are never clipped. Nonlinear
+    stages (Abs, Clip, Threshold, Magnitude) end a fused run; linear stages
+    just before a Magnitude are fused into both of its kernels. The final
+    result is clipped to 0-255 like apply_kernel.
+
+    Pixels within half the fused kernel size of the border are 0, like a
+    single apply_kernel with that kernel; away from the border the result
+    equals running the stages one after another without clipping.
+    """
+    def __init__(self, stages=()):
+        self.stages = list(stages)
+        self._plan = None
+
+    def add(self, stage):
+        """Append a stage (a kernel array is taken as a Linear stage)"""
+        if not isinstance(stage, (Linear, Magnitude) + NONLINEAR_STAGES):
+            stage = Linear(stage)
+        self.stages.append(stage)
+        self._plan = None
+        return self
+
+    def plan(self):
+        """Steps actually run: ('convolve', weights, divisor), ('magnitude', x, y) or a nonlinear stage
+
+        x and y are (weights, divisor) pairs.
+        """
+        if self._plan is not None:
+            return self._plan
+        plan = []
+        pending = None  # (weights, divisor) of the linear run so far
+        for stage in self.stages:
+            if isinstance(stage, Linear):
+                if pending is None:
+                    pending = (stage.weights, stage.divisor)
+                else:
+                    pending = (convolve_kernels(pending[0], stage.weights), pending[1] * stage.divisor)
+            elif isinstance(stage, Magnitude):
+                branches = []
+                for branch in (stage.x, stage.y):
+                    if pending is None:
+                        branches.append((branch.weights, branch.divisor))
+                    else:
+                        branches.append((convolve_kernels(pending[0], branch.weights),
+                                         pending[1] * branch.divisor))
+                plan.append(('magnitude',) + tuple(branches))
+                pending = None
+            else:
+                if pending is not None:
+                    plan.append(('convolve',) + pending)
+                    pending = None
+                plan.append(stage)
+        if pending is not None:
+            plan.append(('convolve',) + pending)
+        self._plan = plan
+        return plan
+
+    @property
+    def unfused_passes(self):
+        """Convolution passes over the image if every stage ran on its own"""
+        return sum(2 if isinstance(stage, Magnitude) else 1
+                   for stage in self.stages if isinstance(stage, (Linear, Magnitude)))
+
+    @property
+    def fused_passes(self):
+        """Convolution passes the fused plan makes"""
+        return sum(2 if step[0] == 'magnitude' else 1
+                   for step in self.plan() if isinstance(step, tuple))
+
+    @property
+    def passes_saved(self):
+        return self.unfused_passes - self.fused_passes
+
+    def describe(self):
+        """One-line summary of the stages and the passes fusion saved"""
+        names = " > ".join(stage.name for stage in self.stages)
+        return f"{names}: {self.fused_passes} passes instead of {self.unfused_passes}"
+
+    def run_float(self, image, backend='auto'):
+        """Run the plan on an array and return the unclipped float result"""
+        values = image
+        for step in self.plan():
+            if not isinstance(step, tuple):
+                values = step.apply(values)
+            elif step[0] == 'convolve':
+                values = convolve2d(values, step[1], backend, divisor=step[2])
+            else:
+                (x_weights, x_divisor), (y_weights, y_divisor) = step[1:]
+                response_x = convolve2d(values, x_weights, backend, divisor=x_divisor)
+                response_y = convolve2d(values, y_weights, backend, divisor=y_divisor)
+                values = np.hypot(response_x, response_y)
+        return np.asarray(values, dtype=float)
+
+    def run(self, image, backend='auto'):
+        """Run the plan on an array (H, W[, C]) and return the uint8 result"""
+        return to_uint8(self.run_float(image, backend))
@@ -0,0 +1,134 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Durations kept per span name for the percentiles
+SPAN_HISTORY = 100
+# Spans kept for trace export (oldest are dropped first)
+MAX_TRACE_EVENTS = 200000
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0..100) of a non-empty sequence"""
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[min(len(ordered), max(rank, 1)) - 1]
+
+class Profiler:
+    """Collects named timing spans from any thread
+
+    Keeps the last SPAN_HISTORY durations of each span name for live
+    statistics, and a bounded log of every span for Chrome-trace export
+    (open the file in chrome://tracing or https://ui.perfetto.dev).
+    """
+    def __init__(self, history=SPAN_HISTORY, max_events=MAX_TRACE_EVENTS, enabled=True):
+        self.enabled = enabled
+        self.history = history
+        self._origin = time.perf_counter()
+        self._durations = OrderedDict()  # name -> deque of seconds, in first-seen order
+        self._events = deque(maxlen=max_events)  # (name, thread id, start, duration, args)
+        self._threads = {}  # thread id -> thread name
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _span(self, name, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter() - start, args)
+
+    def span(self, name, **args):
+        """Context manager timing the enclosed block as a span called name
+
+        Keyword arguments are attached to the trace event.
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(name, args)
+
+    def record(self, name, start, duration, args=None):
+        """Add a span measured elsewhere (start is a time.perf_counter() value)"""
+        thread = threading.current_thread()
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = deque(maxlen=self.history)
+            durations.append(duration)
+            self._events.append((name, thread.ident, start, duration, args))
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def stats(self):
+        """Per span name: last, p50 and p95 duration (seconds) and sample count"""
+        with self._lock:
+            snapshot = [(name, list(durations)) for name, durations in self._durations.items()]
+        return OrderedDict(
+            (name, {
+                'last': durations[-1],
+                'p50': percentile(durations, 50),
+                'p95': percentile(durations, 95),
+                'count': len(durations),
+            })
+            for name, durations in snapshot if durations)
+
+    def clear(self):
+        """Forget all spans"""
+        with self._lock:
+            self._durations.clear()
+            self._events.clear()
+
+    def chrome_trace(self):
+        """The recorded spans in Chrome's trace event format (a dict)"""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        trace_events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}}
+            for tid, thread_name in threads.items()
+        ]
+        for name, tid, start, duration, args in events:
+            event = {
+                'name': name,
+                'ph': 'X',
+                'pid': pid,
+                'tid': tid,
+                'ts': (start - self._origin) * 1e6,
+                'dur': duration * 1e6,
+            }
+            if args:
+                event['args'] = args
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        """Write the recorded spans to a Chrome-trace JSON file
+
+        Returns:
+            Number of spans written
+        """
+        import json  # Only needed for exports; kept off the startup path
+        trace = self.chrome_trace()
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+        return sum(1 for event in trace['traceEvents'] if event['ph'] == 'X')
+
+class _NoSpan:
+    """Reusable do-nothing context manager for a disabled profiler"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+# Shared by the visualizer and the image helpers; off until the visualizer
+# turns it on, so headless tools don't collect spans nobody reads
+PROFILER = Profiler(enabled=False)
+
+def span(name, **args):
+    """Time a block as a span on the shared profiler"""
+    return PROFILER.span(name, **args)
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+def image_hash(image):
+    """Content hash of a PIL image (pixels, size and mode)"""
+    # Imported on first use, which is after the first frame, to keep it off startup
+    import hashlib
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode}{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def result_key(image_digest, kernel, mode):
+    """Cache key for applying kernel to an image (by content hash) in a mode"""
+    kernel = np.ascontiguousarray(kernel, dtype=float)
+    return (image_digest, kernel.shape, kernel.tobytes(), mode)
+
+def result_nbytes(result, surface=None):
+    """Approximate memory held by a result (array or PIL image) and its display surface"""
+    if isinstance(result, np.ndarray):
+        nbytes = result.nbytes
+    else:
+        nbytes = result.width * result.height * len(result.getbands())
+    if surface is not None:
+        nbytes += surface.get_width() * surface.get_height() * surface.get_bytesize()
+    return nbytes
+
+class ResultCache:
+    """LRU cache of kernel results, bounded by total size in bytes
+
+    Entries are evicted least-recently-used first until the cached values
+    fit in max_bytes. A single value larger than the budget is not cached.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key (marking it recently used), or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """Store a value of nbytes, evicting old entries to stay within budget"""
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return False
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Hit/miss counters and memory use"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,341 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from PIL import Image, ImageSequence
+
+from convolution import filter_array
+from parallel import filter_parallel
+from image_utils import image_to_array, array_to_image, COLOR_MODES
+from image_loader import image_files
+from pipeline import Pipeline
+from profiling import span
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None  # Video files need opencv-python; image sequences and GIFs work without it
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+DEFAULT_FPS = 24.0
+QUEUE_SIZE = 4  # Frames buffered between stages
+FPS_WINDOW = 1.0  # Seconds of displayed frames the achieved fps is measured over
+
+class FrameSource:
+    """Frames of a video file, an animated image (GIF, APNG) or a directory of images
+
+    Iterating yields RGB PIL images in order; fps is the source's frame
+    rate, or DEFAULT_FPS when the source doesn't say.
+    """
+    def __init__(self, path, fps=None):
+        self.path = path
+        source_fps = None
+        if os.path.isdir(path):
+            self.kind = 'directory'
+            self.files = image_files(path)
+            if not self.files:
+                raise ValueError(f"No images in {path}")
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            if cv2 is None:
+                raise ValueError("Reading video files needs opencv-python (pip install opencv-python); "
+                                 "image sequences and animated GIFs work without it")
+            self.kind = 'video'
+            capture = cv2.VideoCapture(path)
+            if not capture.isOpened():
+                raise ValueError(f"Cannot open video {path}")
+            source_fps = capture.get(cv2.CAP_PROP_FPS) or None
+            capture.release()
+        else:
+            self.kind = 'animation'
+            with Image.open(path) as image:
+                duration = image.info.get('duration')
+            if duration:
+                source_fps = 1000 / duration
+        self.fps = fps or source_fps or DEFAULT_FPS
+
+    def __iter__(self):
+        if self.kind == 'directory':
+            for file in self.files:
+                with Image.open(file) as image:
+                    yield image.convert('RGB')
+        elif self.kind == 'video':
+            capture = cv2.VideoCapture(self.path)
+            try:
+                while True:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    yield Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            finally:
+                capture.release()
+        else:
+            with Image.open(self.path) as image:
+                for frame in ImageSequence.Iterator(image):
+                    yield frame.convert('RGB')
+
+class StreamStats:
+    """Frame counters of a stream and its achieved display rate"""
+    def __init__(self):
+        self.decoded = 0
+        self.convolved = 0
+        self.displayed = 0
+        self.dropped = 0
+        self._displayed_at = deque()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        """Add one to a counter ('decoded', 'convolved' or 'dropped')"""
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def frame_displayed(self):
+        """Count a frame handed to the display stage"""
+        now = time.perf_counter()
+        with self._lock:
+            self.displayed += 1
+            self._displayed_at.append(now)
+            while self._displayed_at and self._displayed_at[0] < now - FPS_WINDOW:
+                self._displayed_at.popleft()
+
+    def fps(self):
+        """Frames displayed per second over the last FPS_WINDOW seconds"""
+        with self._lock:
+            if len(self._displayed_at) < 2:
+                return 0.0
+            elapsed = self._displayed_at[-1] - self._displayed_at[0]
+            return (len(self._displayed_at) - 1) / elapsed if elapsed > 0 else 0.0
+
+class StreamPipeline:
+    """Decode and convolve a frame source on two threads connected by bounded queues
+
+    The decode stage reads frames and converts them to arrays in the current
+    mode; the convolve stage applies whatever kernel (or Pipeline)
+    get_kernel() returns at that moment, so kernel edits show up on the next
+    frame. Results are
+    taken from the output queue by a display stage (the visualizer's frame
+    loop or write_sequence).
+
+    In realtime mode frames are decoded at the source's frame rate, and a
+    stage that finds its output queue full drops the oldest queued frame
+    instead of waiting, so a slow stage costs frames rather than falling
+    behind playback. Otherwise every frame is processed as fast as possible
+    (for throughput tests).
+    """
+    def __init__(self, source, get_kernel, mode='L', realtime=True, loop=False, queue_size=QUEUE_SIZE, workers=1):
+        if mode not in COLOR_MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        self.source = source
+        self.get_kernel = get_kernel
+        self.mode = mode  # May be changed while running; applies from the next decoded frame
+        self.realtime = realtime
+        self.loop = loop
+        self.workers = workers  # Threads each frame's rows are split over (see parallel.filter_parallel)
+        self.stats = StreamStats()
+        self._decoded = queue.Queue(queue_size)
+        self._output = queue.Queue(queue_size)
+        self._stopped = threading.Event()
+        self._threads = [threading.Thread(target=self._decode_loop, name="stream-decode", daemon=True),
+                         threading.Thread(target=self._convolve_loop, name="stream-convolve", daemon=True)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Stop both stages (frames still queued are discarded)"""
+        self._stopped.set()
+        for stage_queue in (self._decoded, self._output):
+            while True:
+                try:
+                    stage_queue.get_nowait()
+                except queue.Empty:
+                    break
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
+
+    def poll(self):
+        """Newest processed frame as (index, frame, output, mode, alpha), or None
+
+        Older frames still waiting are dropped, so the display never lags.
+        Returns None when nothing new is ready (and after the end of the stream).
+        """
+        latest = None
+        while True:
+            try:
+                item = self._output.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._output.put(None)  # Keep the end marker for the next poll
+                break
+            if latest is not None:
+                self.stats.count('dropped')
+            latest = item
+        if latest is not None:
+            self.stats.frame_displayed()
+        return latest
+
+    def frames(self):
+        """Yield every processed frame in order until the stream ends (blocking)"""
+        while True:
+            item = self._output.get()
+            if item is None:
+                return
+            self.stats.frame_displayed()
+            yield item
+
+    def _put(self, stage_queue, item):
+        """Queue an item, dropping the oldest queued frame when full in realtime mode"""
+        while not self._stopped.is_set():
+            if self.realtime:
+                try:
+                    stage_queue.put_nowait(item)
+                    return True
+                except queue.Full:
+                    try:
+                        stage_queue.get_nowait()
+                        self.stats.count('dropped')
+                    except queue.Empty:
+                        pass
+            else:
+                try:
+                    stage_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+        return False
+
+    def _finish(self, stage_queue):
+        """Pass the end-of-stream marker on (never dropped)"""
+        while not self._stopped.is_set():
+            try:
+                stage_queue.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _decode_loop(self):
+        index = 0
+        start = time.perf_counter()
+        try:
+            while not self._stopped.is_set():
+                for image in self.source:
+                    if self._stopped.is_set():
+                        return
+                    if self.realtime:
+                        # Hold each frame until its presentation time
+                        delay = start + index / self.source.fps - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    mode = self.mode
+                    with span('stream.decode'):
+                        frame = image_to_array(image, mode)
+                    self.stats.count('decoded')
+                    if not self._put(self._decoded, (index, frame, mode)):
+                        return
+                    index += 1
+                if not self.loop:
+                    break
+        except Exception as e:
+            print(f"Error decoding {self.source.path}: {e}")
+        self._finish(self._decoded)
+
+    def _convolve_loop(self):
+        while not self._stopped.is_set():
+            try:
+                item = self._decoded.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            index, frame, mode = item
+            alpha = None
+            source = frame
+            if mode == 'RGBA':
+                source, alpha = frame[..., :3], frame[..., 3]
+            try:
+                kernel = self.get_kernel()
+                with span('stream.convolve'):
+                    if isinstance(kernel, Pipeline):
+                        output = kernel.run(source)
+                    elif self.workers == 1:
+                        output = filter_array(source, kernel)
+                    else:
+                        output = filter_parallel(source, kernel, self.workers)
+            except Exception as e:
+                print(f"Error applying kernel to frame {index}: {e}")
+                continue
+            self.stats.count('convolved')
+            if not self._put(self._output, (index, frame, output, mode, alpha)):
+                return
+        self._finish(self._output)
+
+def write_sequence(pipeline, output_dir, extension='.png'):
+    """Display stage for headless runs: write every processed frame to output_dir
+
+    Returns:
+        (frames written, seconds elapsed)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    written = 0
+    for index, _, output, mode, alpha in pipeline.frames():
+        image = array_to_image(output, mode, alpha)
+        if mode == 'RGBA' and extension in ('.jpg', '.jpeg'):
+            image = image.convert('RGB')  # JPEG has no alpha channel
+        image.save(os.path.join(output_dir, f"frame_{index:06d}{extension}"))
+        written += 1
+    return written, time.perf_counter() - start
+
+def main(argv=None):
+    from batch import load_kernel, PRESET_HELP
+
+    parser = argparse.ArgumentParser(description="Apply a kernel live to a video, animated image or image directory")
+    parser.add_argument('input', help="Video file (needs opencv-python), GIF/APNG, or directory of frames")
+    parser.add_argument('--output', metavar='DIR', help="Write processed frames here instead of opening a window")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--preset', help=PRESET_HELP)
+    source.add_argument('--kernel', help="Kernel file: .npy or whitespace-separated text")
+    parser.add_argument('--mode', choices=COLOR_MODES, default='L', help="Processing mode (default: L)")
+    parser.add_argument('--fps', type=float, default=None, help="Override the source frame rate")
+    parser.add_argument('--realtime', action='store_true',
+                        help="With --output: pace at the source frame rate and drop frames under load")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Threads to split each frame over (0: one per CPU core; default: 1)")
+    args = parser.parse_args(argv)
+
+    try:
+        source = FrameSource(args.input, args.fps)
+        kernel = load_kernel(args.preset, args.kernel) if args.preset or args.kernel else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.output:
+        if kernel is None:
+            parser.error("--output needs --preset or --kernel")
+        pipeline = StreamPipeline(source, lambda: kernel, args.mode, realtime=args.realtime,
+                                  workers=args.workers or None).start()
+        written, elapsed = write_sequence(pipeline, args.output)
+        pipeline.stop()
+        stats = pipeline.stats
+        rate = written / elapsed if elapsed > 0 else 0.0
+        print(f"Wrote {written} frames in {elapsed:.2f}s ({rate:.1f} fps, source {source.fps:.1f} fps, "
+              f"{stats.dropped} dropped) -> {args.output}")
+        return 0
+
+    # Interactive: the visualizer's kernel editor drives the stream
+    from main import KernelVisualizer
+    app = KernelVisualizer()
+    if kernel is not None:
+        app.kernel_editor.set_kernel(kernel)
+    app.start_stream(source, args.mode, args.workers or None)
+    app.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
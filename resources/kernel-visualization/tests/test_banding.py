@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from convolution import filter_array, select_backend, band_backend
+from image_utils import image_to_array, create_test_image
+from kernels import box, gaussian
+from parallel import filter_parallel
+from tiled import filter_tiled
+
+SIZE = (400, 300)  # Large enough for the cost model to send gaussian(4) to the FFT
+
+def float_image(channels=()):
+    """Float image on a 0.1 grid, so many window means are whole numbers and rounding decides the output"""
+    return np.random.default_rng(0).integers(0, 2560, (SIZE[1], SIZE[0]) + channels) / 10
+
+def band_reference(image, kernel):
+    """Whole-image filter_array with the band-safe backend banded filtering uses"""
+    return filter_array(image, kernel, band_backend(image.shape, kernel, dtype=image.dtype))
+
+def test_filter_array_keeps_fft_for_float_kernel():
+    kernel = gaussian(4.0)
+    assert select_backend((SIZE[1], SIZE[0]), kernel) == 'fft'
+    image = image_to_array(create_test_image(SIZE))
+    assert np.array_equal(filter_array(image, kernel), filter_array(image, kernel, 'fft'))
+    assert band_backend(image.shape, kernel) != 'fft'
+
+def test_tiled_matches_whole_image_for_fft_kernel(tmp_path):
+    image = create_test_image(SIZE)
+    kernel = gaussian(4.0)
+    tiled = filter_tiled(image, kernel, str(tmp_path / 'out.npy'), tile_rows=64)
+    assert np.array_equal(tiled, band_reference(image_to_array(image), kernel))
+
+def test_tiled_matches_whole_image_for_box_on_float_image(tmp_path):
+    image = float_image()
+    kernel = box(12)
+    assert select_backend(image.shape, kernel) == 'box'
+    tiled = filter_tiled(image, kernel, str(tmp_path / 'out.npy'), tile_rows=64)
+    assert np.array_equal(tiled, band_reference(image, kernel))
+
+@pytest.mark.parametrize('workers', [1, 2, 4])
+@pytest.mark.parametrize('kernel', [gaussian(4.0), box(12)], ids=['gaussian', 'box'])
+@pytest.mark.parametrize('integer', [True, False], ids=['uint8', 'float'])
+def test_parallel_matches_whole_image(workers, kernel, integer):
+    image = float_image((3,))
+    if integer:
+        image = image.astype(np.uint8)
+    assert np.array_equal(filter_parallel(image, kernel, workers), band_reference(image, kernel))
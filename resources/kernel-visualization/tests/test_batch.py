@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from batch import find_jobs, load_manifest, run_batch, save_manifest, settings_key
+
+def make_inputs(directory, count=2):
+    os.makedirs(directory)
+    for index in range(count):
+        pixels = np.random.default_rng(index).integers(0, 256, (20, 30, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(os.path.join(directory, f"{index}.png"))
+
+def run(input_dir, output_dir, kernel, mode='L', border='black'):
+    """What batch.main does, returning the number of images processed"""
+    key = settings_key(kernel, mode, border)
+    manifest = load_manifest(output_dir)
+    jobs, _ = find_jobs(input_dir, output_dir, key=key, manifest=manifest)
+
+    def record(src, dst):
+        manifest[os.path.basename(dst)] = key
+
+    run_batch(jobs, kernel, mode, workers=1, border=border, on_done=record)
+    save_manifest(output_dir, manifest)
+    return len(jobs)
+
+def test_changed_settings_are_not_up_to_date(tmp_path):
+    input_dir = str(tmp_path / 'in')
+    output_dir = str(tmp_path / 'out')
+    make_inputs(input_dir)
+    os.makedirs(output_dir)
+    sharpen = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+
+    assert run(input_dir, output_dir, sharpen) == 2
+    assert run(input_dir, output_dir, sharpen) == 0
+    assert run(input_dir, output_dir, np.ones((3, 3))) == 2
+    assert run(input_dir, output_dir, np.ones((3, 3)), mode='RGB') == 2
+    assert run(input_dir, output_dir, np.ones((3, 3)), mode='RGB', border='wrap') == 2
+    assert run(input_dir, output_dir, np.ones((3, 3)), mode='RGB', border='wrap') == 0
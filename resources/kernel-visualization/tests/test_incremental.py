@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from convolution import IncrementalConvolver, filter_array
+
+def image():
+    return np.random.default_rng(0).integers(0, 256, (90, 120, 3), dtype=np.uint8)
+
+def integer_kernel():
+    return np.random.default_rng(1).integers(-3, 6, (5, 5))
+
+def float_kernel():
+    """Non-separable weights on a 1/8 grid, so sums of 8-bit pixels are exact in float"""
+    return np.random.default_rng(2).integers(-8, 17, (5, 5)) / 8
+
+@pytest.mark.parametrize('border', ['black', 'reflect'])
+@pytest.mark.parametrize('make_kernel', [integer_kernel, float_kernel], ids=['integer', 'float'])
+def test_single_cell_edit_matches_filter_array(make_kernel, border):
+    img = image()
+    kernel = make_kernel()
+    convolver = IncrementalConvolver(img, border)
+    assert np.array_equal(convolver.update(kernel), filter_array(img, kernel, border=border))
+
+    edited = kernel.copy()
+    edited[1, 3] += 2
+    result = convolver.update(edited)
+    assert convolver.incremental_updates == 1
+    assert np.array_equal(result, filter_array(img, edited, border=border))
@@ -0,0 +1,117 @@
+import argparse
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+from convolution import filter_array, band_backend
+from parallel import filter_parallel
+from image_utils import image_to_array, COLOR_MODES
+
+# Output rows computed per band; for array sources peak memory is about this
+# many rows (plus the kernel halo) of input and accumulator, whatever the image size
+DEFAULT_TILE_ROWS = 256
+
+def read_rows(source, top, bottom, mode):
+    """Rows [top, bottom) of an array-like or PIL image, as the array to convolve
+
+    PIL can't decode part of a file: the first crop decodes the whole image,
+    which then stays in memory.
+    """
+    if isinstance(source, Image.Image):
+        return image_to_array(source.crop((0, top, source.width, bottom)), mode)
+    return np.asarray(source[top:bottom])
+
+def source_shape(source, mode):
+    """Shape of the array apply_kernel would convolve for source"""
+    if isinstance(source, Image.Image):
+        channels = () if mode == 'L' else (len(mode),)
+        return (source.height, source.width) + channels
+    return source.shape
+
+def filter_tiled(source, kernel, output_path, mode='L', tile_rows=DEFAULT_TILE_ROWS, backend='auto', workers=1):
+    """Filter an image in horizontal bands into a memory-mapped .npy file
+
+    Each band of output rows is computed from its input rows plus a halo of
+    kernel_size // 2 rows above and below, so results at band edges are
+    exactly those of the whole image.
+
+    Args:
+        source: Array-like of shape (H, W[, C]) that can be sliced by rows,
+            e.g. np.load(path, mmap_mode='r'), or a PIL image (converted
+            band by band according to mode). Only array sources keep memory
+            bounded: a PIL image is decoded in full on the first band.
+        kernel: 2D array of weights or a kernels.Kernel (passed on as it is)
+        output_path: Path of the .npy file to write
+        mode: Processing mode for PIL sources ('L', 'RGB' or 'RGBA')
+        tile_rows: Output rows per band
+        backend: Convolution backend, or 'auto' to choose a band-safe one
+            from the full image (see convolution.band_backend)
+        workers: Threads each band is split over (see parallel.filter_parallel)
+
+    Returns:
+        The output as a read/write np.memmap of shape (H, W[, C])
+    """
+    if mode not in COLOR_MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    shape = source_shape(source, mode)
+    height = shape[0]
+    k_height = np.asarray(kernel).shape[0]
+    halo_top = k_height // 2
+    halo_bottom = k_height - 1 - halo_top
+    if backend == 'auto':
+        dtype = np.uint8 if isinstance(source, Image.Image) else source.dtype
+        backend = band_backend(shape, kernel, dtype=dtype)
+
+    output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.uint8, shape=shape)
+    for top in range(0, height, tile_rows):
+        bottom = min(top + tile_rows, height)
+        in_top = max(0, top - halo_top)
+        in_bottom = min(height, bottom + halo_bottom)
+
+        rows = read_rows(source, in_top, in_bottom, mode)
+        if workers == 1:
+            band = filter_array(rows, kernel, backend)
+        else:
+            band = filter_parallel(rows, kernel, workers, backend)
+        output[top:bottom] = band[top - in_top:bottom - in_top]
+
+    output.flush()
+    return output
+
+def main(argv=None):
+    from batch import load_kernel, PRESET_HELP
+
+    parser = argparse.ArgumentParser(description="Filter a very large image in bands into a .npy file")
+    parser.add_argument('input', help="Image file (decoded fully into memory), or .npy array "
+                                      "(memory-mapped; keeps memory bounded)")
+    parser.add_argument('output', help="Output .npy file")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--preset', help=PRESET_HELP)
+    source.add_argument('--kernel', help="Kernel file: .npy or whitespace-separated text")
+    parser.add_argument('--mode', choices=COLOR_MODES, default='L', help="Processing mode for image files")
+    parser.add_argument('--tile-rows', type=int, default=DEFAULT_TILE_ROWS, help="Output rows per band")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Threads to split each band over (0: one per CPU core; default: 1)")
+    args = parser.parse_args(argv)
+
+    try:
+        kernel = load_kernel(args.preset, args.kernel)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.input.endswith('.npy'):
+        image = np.load(args.input, mmap_mode='r')
+    else:
+        Image.MAX_IMAGE_PIXELS = None  # Large scans are the point here
+        image = Image.open(args.input)
+
+    start = time.perf_counter()
+    output = filter_tiled(image, kernel, args.output, args.mode, args.tile_rows, workers=args.workers or None)
+    elapsed = time.perf_counter() - start
+    megapixels = output.shape[0] * output.shape[1] / 1e6
+    print(f"Filtered {megapixels:.1f} MP in {elapsed:.2f}s ({megapixels / elapsed:.1f} MP/s) -> {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,21 @@ TEXT_COLOR = (220, 230, 240)  # Light blue-white for text
 BUTTON_IDLE = (40, 45, 60)  # Button background
 BUTTON_HOVER = (60, 70, 90)  # Button hover state
 
+# Rendered text surfaces, keyed on (font, text, color)
+_text_cache = {}
+TEXT_CACHE_SIZE = 512
+
+def render_text(font, text, color):
+    """Render antialiased text, reusing the surface for repeated requests"""
+    key = (font, text, color)
+    surface = _text_cache.get(key)
+    if surface is None:
+        if len(_text_cache) >= TEXT_CACHE_SIZE:
+            _text_cache.clear()
+        surface = font.render(text, True, color)
+        _text_cache[key] = surface
+    return surface
+
 class Button:
     def __init__(self, x, y, width, height, text, action=None):
         self.rect = pygame.Rect(x, y, width, height)
@@ -32,7 +47,7 @@ class Button:
             glow_rect = self.rect.inflate(4, 4)
             pygame.draw.rect(surface, ACCENT_CYAN, glow_rect, 1, border_radius=12)
         
-        text_surface = font.render(self.text, True, TEXT_COLOR)
+        text_surface = render_text(font, self.text, TEXT_COLOR)
         text_rect = text_surface.get_rect(center=self.rect.center)
         surface.blit(text_surface, text_rect)
         
@@ -66,7 +81,7 @@ def draw_panel(surface, x, y, width, height, title=None, font=None):
     pygame.draw.rect(surface, ACCENT_BLUE, panel_rect, 2, border_radius=10)
     
     if title and font:
-        title_text = font.render(title, True, TEXT_COLOR)
+        title_text = render_text(font, title, TEXT_COLOR)
         title_rect = title_text.get_rect(center=(x + width // 2, y + 15))
         surface.blit(title_text, title_rect)
         
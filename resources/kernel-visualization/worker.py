@@ -0,0 +1,103 @@
+import inspect
+import threading
+
+class LatestWinsWorker:
+    """Runs jobs on a background thread, keeping only the newest request
+
+    submit() never blocks: a job that hasn't started yet is simply replaced
+    by a newer one, so when requests arrive faster than they complete only
+    the latest is computed. Results of jobs that were overtaken by a newer
+    submission while running are discarded.
+
+    A job may also be a generator function: every value it yields is
+    published as it is produced (e.g. a quick preview, then the final
+    result), and the job is abandoned at the next yield once a newer
+    request is waiting.
+    """
+    def __init__(self, name="convolution-worker"):
+        self._condition = threading.Condition()
+        self._pending = None      # (generation, job) waiting to start
+        self._submitted = 0       # generation of the newest submission
+        self._finished = 0        # generation of the last finished job
+        self._result = None       # (generation, value) not collected yet
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        """Queue a callable, replacing any job that hasn't started yet
+
+        Returns:
+            The generation number of the submission
+        """
+        with self._condition:
+            self._submitted += 1
+            self._pending = (self._submitted, job)
+            self._condition.notify_all()
+            return self._submitted
+
+    def poll(self):
+        """Return the result of the newest job once it has landed, else None"""
+        with self._condition:
+            result, self._result = self._result, None
+            if result is None or result[0] != self._submitted:
+                return None
+            return result[1]
+
+    @property
+    def busy(self):
+        """True while the newest submission hasn't finished"""
+        with self._condition:
+            return self._finished != self._submitted
+
+    def wait(self, timeout=None):
+        """Block until the newest submission has finished (for scripts, not the UI)"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._finished == self._submitted, timeout)
+
+    def stop(self):
+        """Stop the worker thread once the running job (if any) is done"""
+        with self._condition:
+            self._running = False
+            self._pending = None
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while self._pending is None and self._running:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                generation, job = self._pending
+                self._pending = None
+
+            try:
+                value = job()
+                if inspect.isgenerator(value):
+                    for partial in value:
+                        if not self._publish(generation, partial):
+                            value.close()
+                            break
+                else:
+                    self._publish(generation, value)
+            except Exception as e:
+                print(f"Error in background job: {e}")
+
+            with self._condition:
+                self._finished = generation
+                self._condition.notify_all()
+
+    def _publish(self, generation, value):
+        """Make value available to poll() if its job is still the newest
+
+        Returns:
+            False when a newer job was submitted (the result is stale)
+        """
+        with self._condition:
+            if generation != self._submitted:
+                return False
+            if value is not None:
+                self._result = (generation, value)
+            return True